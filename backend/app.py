@@ -1,186 +1,295 @@
-from flask import Flask, request
+import time
+# 模块导入耗时从这里开始计，由 / 报告
+_import_started = time.perf_counter()
+from flask import Flask, Response, request
 from flask_cors import CORS
-from flask_socketio import SocketIO
-import cv2
-import numpy as np
+from flask_socketio import SocketIO, join_room
 import base64
-from io import BytesIO
-from PIL import Image
-from math import sqrt
 import eventlet
 import eventlet.green.threading as threading
+from sessions import SessionRegistry
+from ingest import unpack_frame
+from inference import InferencePool
+from results import FrameResult, publish, EVENT_MODES, LandmarkEncoder, landmark_encoder
+from decoder import FrameDecoder
+from earm import EarmBlinkDetector
+import blinks
+from tracking import FaceTracks
+from calibration import StreamingCalibration
+import profiles
+import pubsub
+import geometry
+import config
+import metrics
+from metrics import STAGE_SECONDS, EMITS, ERRORS
+from models import STARTUP
 
 eventlet.monkey_patch()
 
 app = Flask(__name__)
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
-
-# 初始化 MediaPipe
-import mediapipe as mp
-mp_face_mesh = mp.solutions.face_mesh
-face_mesh = mp_face_mesh.FaceMesh(static_image_mode=False, max_num_faces=1,
-                                   min_detection_confidence=0.5, min_tracking_confidence=0.5)
-mp_drawing = mp.solutions.drawing_utils
-
-LEFT_EYE = [33, 160, 158, 133, 153, 144]
-RIGHT_EYE = [362, 385, 387, 263, 373, 380]
-MOUTH_OUTER = [61, 185, 40, 39, 37, 0, 267, 269, 270, 409, 291,
-               375, 321, 405, 314, 17, 84, 181, 91, 146]
-MOUTH_INNER = [78, 95, 88, 178, 87, 14, 317, 402, 318, 324,
-               308, 415, 310, 311, 312, 13, 82, 81, 80, 191]
+# 多进程部署时 emit 经 MESSAGE_QUEUE 转发，送达连接在其他进程上的客户端
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet',
+                    **pubsub.server_options(config.MESSAGE_QUEUE))
+
+# FaceMesh 推理在独立进程中执行，避免 CPU 密集的调用阻塞 eventlet 主循环
+# 主进程不导入 mediapipe；工作进程在预热或第一帧时才加载模型
+inference_pool = InferencePool(workers=config.INFERENCE_WORKERS, inflight=config.INFERENCE_INFLIGHT,
+                               max_num_faces=1, min_detection_confidence=0.5, min_tracking_confidence=0.5,
+                               crop_side=config.CROP_SIDE, crop_pad=config.CROP_PAD)
+
+class PlayerState:
+    # 每个玩家（人脸）独立的校准；EAR 的眨眼状态在 BlinkDetector.blinks 里按玩家编号存放
+    def __init__(self, method="ear", earm_mode=None):
+        # EAR 阈值的流式校准，校准期间也照常检测
+        self.calibration = StreamingCalibration(config.EAR_BASELINE, config.CALIBRATION_FRAMES,
+                                                config.CALIBRATION_RATE)
+        # ear：EAR 低于阈值即判定闭眼；earm：EARM 滤波（见 earm.py），只输出双眼合并的状态与眨眼
+        self.earm = EarmBlinkDetector(mode=earm_mode or config.EARM_MODE) if method == "earm" else None
+
+    def start_calibration(self):
+        self.calibration.restart()
+        if self.earm is not None:
+            self.earm.start_calibration()
 
 class BlinkDetector:
-    def __init__(self):
-        self.blink_counter = 0
-        self.total_blinks = 0
-        self.current_eye_state = "open"
-        self.calibrating = True
-        self.ratios = []
-        self.min_ratio = float("inf")
-        self.max_ratio = float("-inf")
-        self.threshold = 0.3
-
-        # 新增左右眼检测
-        self.left_blink_counter = 0
-        self.right_blink_counter = 0
-        self.left_total_blinks = 0
-        self.right_total_blinks = 0
-
-        # 新增双眼状态跟踪
-        self.left_eye_state = "open"
-        self.right_eye_state = "open"
-
-    def _blink_ratio(self, landmarks, eye_points):
-        def euclidean(p1, p2):
-            x1, y1, z1 = p1
-            x2, y2, z2 = p2
-            return sqrt((x2 - x1)**2 + (y2 - y1)**2 + (z2 - z1)**2)
-
-        hor = euclidean(landmarks[eye_points[0]], landmarks[eye_points[3]])
-        ver1 = euclidean(landmarks[eye_points[1]], landmarks[eye_points[5]])
-        ver2 = euclidean(landmarks[eye_points[2]], landmarks[eye_points[4]])
-        ver = (ver1 + ver2) / 2.0
-        return ver / hor if hor != 0 else 0
-
-    def process_frame(self, frame):
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = face_mesh.process(rgb)
-        if not results.multi_face_landmarks:
+    def __init__(self, emit, key, event_mode="legacy", pool=None, method="ear", earm_mode=None, landmarks=None,
+                 players=1, profile=None):
+        # emit(event, data)：由会话绑定到对应房间
+        self.emit = emit
+        # 离线工具可以传入进程内推理的 InferencePool(workers=0)
+        self.pool = pool or inference_pool
+        # frame_result：每帧一条合并消息；legacy：旧的逐事件消息；both：两者都发
+        self.event_mode = event_mode
+        # 关键点的编码格式与发送频率上限
+        self.landmarks = landmarks or LandmarkEncoder()
+        self.method = method
+        self.earm_mode = earm_mode
+        self.frames = 0
+        # 当前帧的客户端序号，写进 frame_result（见 ingest.unpack_frame）
+        self.seq = None
+        # JPEG 直接解码成 MediaPipe 需要的 RGB，缓冲区按会话复用
+        self.decoder = FrameDecoder("rgb", config.DECODE_SCALE)
+        # 推理池按 key 为每个会话维护独立的跟踪器，避免多人的帧互相干扰跟踪状态
+        self.key = key
+        # 本地多人：同一画面里最多 players 张脸，一次推理，按质心匹配到各自的玩家状态
+        self.max_players = players
+        self.tracks = FaceTracks(players)
+        self.players = {}
+        # 所有玩家的双眼 / 左眼 / 右眼状态机，每帧一次更新
+        self.blinks = blinks.BlinkStates(players)
+        # 客户端的校准档案（profiles.Profile），对应 0 号玩家
+        self.profile = profile
+        # 0 号玩家出现前收到了重新校准请求：从档案恢复后接着重新校准
+        self.recalibrate = False
+
+    def player(self, player):
+        state = self.players.get(player)
+        if state is None:
+            state = self.players[player] = PlayerState(self.method, self.earm_mode)
+            if player == 0 and self.profile is not None and self.profile.calibration:
+                # 回来的玩家直接用上次的阈值检测，校准只在此基础上细化
+                state.calibration.restore(self.profile.calibration)
+                if self.recalibrate:
+                    state.calibration.restart()
+        return state
+
+    def save_profile(self):
+        state = self.players.get(0)
+        if self.profile is None or state is None or state.calibration.state() is None:
+            return
+        self.profile.save(state.calibration.state(), {"method": self.method, "players": self.max_players})
+
+    def start_calibration(self):
+        for state in self.players.values():
+            state.start_calibration()
+        self.recalibrate = 0 not in self.players
+
+    def close(self):
+        # 断开时保存一次，带上校准结束后持续跟踪到的漂移
+        self.save_profile()
+        self.pool.release(self.key)
+
+    def process_frame(self, rgb):
+        # inference 含共享内存拷贝与进程间往返，face_mesh 只是工作进程内的推理耗时
+        with STAGE_SECONDS.time(stage="inference"):
+            faces = self.pool.process(self.key, rgb, self.max_players)
+        if faces is None:
             return
 
-        for face_landmarks in results.multi_face_landmarks:
-            landmarks = [(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark]
-            left_ratio = self._blink_ratio(landmarks, LEFT_EYE)
-            right_ratio = self._blink_ratio(landmarks, RIGHT_EYE)
-            avg_ratio = (left_ratio + right_ratio) / 2
+        with STAGE_SECONDS.time(stage="detect"):
+            result = self._detect(faces)
+        # 整帧结果一次性发送
+        with STAGE_SECONDS.time(stage="emit"):
+            publish(self.emit, result, self.event_mode)
+
+    def _detect(self, faces):
+        self.frames += 1
+        result = FrameResult(self.frames, self.seq)
+        # 所有人脸的眼部 / 嘴部比值一次向量化算出
+        all_ratios = geometry.face_ratios(faces)
+        layout = geometry.MEDIAPIPE
+        send_landmarks = self.landmarks.due()
+        multiplayer = self.max_players > 1
+        matched = [(player, points, ratios)
+                   for player, points, ratios in zip(self.tracks.assign(faces), faces, all_ratios)
+                   if player is not None]
+        # 用 EAR 判定的玩家：(编号, 比值, 阈值)，最后一起交给状态机
+        blink_rows = []
+        for player, points, ratios in sorted(matched, key=lambda item: item[0]):
+            state = self.player(player)
+            left_ratio, right_ratio, avg_ratio, mouth_ratio = ratios.tolist()
 
             # 提取关键点用于可视化
-            left_eye_points = [landmarks[i] for i in LEFT_EYE]
-            right_eye_points = [landmarks[i] for i in RIGHT_EYE]
-            mouth_outer = [landmarks[i] for i in MOUTH_OUTER]
-            mouth_inner = [landmarks[i] for i in MOUTH_INNER]
-            # print(left_eye_points)
-            socketio.start_background_task(lambda: socketio.emit("eye_landmarks", {
-                "left_eye": left_eye_points,
-                "right_eye": right_eye_points,
-                "mouth_outer": mouth_outer,
-                "mouth_inner": mouth_inner
-            }))
-
-            # 校准
-            if self.calibrating:
-                self.min_ratio = min(self.min_ratio, avg_ratio)
-                self.max_ratio = max(self.max_ratio, avg_ratio)
-                self.ratios.append(avg_ratio)
-                if len(self.ratios) >= 100:
-                    self.threshold = self.min_ratio + (self.max_ratio - self.min_ratio) * 0.4
-                    self.calibrating = False
-                    socketio.start_background_task(lambda: socketio.emit("calibrated", {
-                        "threshold": self.threshold
-                    }))
-                return
-
-            # 整体眨眼检测
-            if avg_ratio < self.threshold:
-                if self.current_eye_state != "closed":
-                    self.current_eye_state = "closed"
-                    socketio.start_background_task(lambda: socketio.emit("eye_state", {"status": "closed"}))
-                self.blink_counter += 1
-            else:
-                if self.blink_counter > 2:
-                    self.total_blinks += 1
-                    socketio.start_background_task(lambda: socketio.emit("blink_event", {
-                        "total": self.total_blinks
-                    }))
-                self.blink_counter = 0
-                if self.current_eye_state != "open":
-                    self.current_eye_state = "open"
-                    socketio.start_background_task(lambda: socketio.emit("eye_state", {"status": "open"}))
-
-            # 左眼眨眼检测
-            if left_ratio < self.threshold:
-                self.left_blink_counter += 1
-                if self.left_eye_state != "closed":
-                    self.left_eye_state = "closed"
-                    socketio.start_background_task(lambda: socketio.emit("left_eye_state", {"status": "closed"}))
-            else:
-                if self.left_blink_counter > 2:
-                    self.left_total_blinks += 1
-                    socketio.start_background_task(lambda: socketio.emit("left_blink_event", {
-                        "total": self.left_total_blinks
-                    }))
-                self.left_blink_counter = 0
-                if self.left_eye_state != "open":
-                    self.left_eye_state = "open"
-                    socketio.start_background_task(lambda: socketio.emit("left_eye_state", {"status": "open"}))
-
-            # 右眼眨眼检测
-            if right_ratio < self.threshold:
-                self.right_blink_counter += 1
-                if self.right_eye_state != "closed":
-                    self.right_eye_state = "closed"
-                    socketio.start_background_task(lambda: socketio.emit("right_eye_state", {"status": "closed"}))
-            else:
-                if self.right_blink_counter > 2:
-                    self.right_total_blinks += 1
-                    socketio.start_background_task(lambda: socketio.emit("right_blink_event", {
-                        "total": self.right_total_blinks
-                    }))
-                self.right_blink_counter = 0
-                if self.right_eye_state != "open":
-                    self.right_eye_state = "open"
-                    socketio.start_background_task(lambda: socketio.emit("right_eye_state", {"status": "open"}))
-            socketio.start_background_task(lambda: socketio.emit("ear_value", {
-                "value": avg_ratio
-            }))
-
-detector = BlinkDetector()
+            landmarks = self.landmarks.encode(points, layout) if send_landmarks else None
+            face_ratios = {"avg": avg_ratio, "left": left_ratio, "right": right_ratio,
+                           "mouth": mouth_ratio}
+            # 单人模式下事件不带玩家编号，与旧格式一致
+            calibrating = self._detect_face(result, state, avg_ratio, face_ratios,
+                                            player if multiplayer else None)
+            if state.earm is None:
+                blink_rows.append((player, ratios[blinks.COLUMNS], state.calibration.threshold))
+            if multiplayer:
+                result.add_player(player, landmarks, face_ratios, calibrating)
+            if result.ratios is None:
+                result.landmarks = landmarks
+                result.ratios = face_ratios
+                result.calibrating = calibrating
+
+        if blink_rows:
+            players, values, thresholds = zip(*blink_rows)
+            transitions = self.blinks.update(values, thresholds, players)
+            for player, name, data in self.blinks.events(transitions):
+                result.add(name, data, player if multiplayer else None)
+
+        return result
+
+    def _detect_face(self, result, state, avg_ratio, face_ratios, player):
+        # EARM 检测与 EAR 阈值校准；返回本帧报告的校准状态
+        if state.earm is not None:
+            earm_val, events = state.earm.update(avg_ratio)
+            face_ratios["earm"] = earm_val
+            for name, data in events:
+                result.add(name, data, player)
+            return state.earm.calibrating
+
+        # 阈值每帧更新；每轮校准结束、从档案恢复后的第一帧各通知一次，并保存到档案
+        if state.calibration.update(avg_ratio):
+            result.add("calibrated", {
+                "threshold": state.calibration.threshold
+            }, player)
+            if state is self.players.get(0):
+                self.save_profile()
+        return state.calibration.calibrating
+
+def create_detector(session):
+    # 档案里保存的设置作为默认值，本次连接 auth 里明确指定的选项优先
+    profile = profiles.STORE.bind(session.options.get("profile"))
+    options = dict(profile.settings, **session.options) if profile is not None else session.options
+    event_mode = options.get("events")
+    if event_mode not in EVENT_MODES:
+        event_mode = config.EVENT_MODE
+    method = options.get("method")
+    if method not in ("ear", "earm"):
+        method = config.BLINK_METHOD
+    try:
+        players = min(max(int(options.get("players") or 1), 1), config.MAX_PLAYERS)
+    except (TypeError, ValueError):
+        players = 1
+
+    def emit(event, data):
+        EMITS.inc(event=event)
+        socketio.emit(event, data, to=session.channel)
+
+    return BlinkDetector(emit, session.sid, event_mode, method=method,
+                         landmarks=landmark_encoder(options), players=players, profile=profile)
+
+sessions = SessionRegistry(create_detector, mailbox_slots=config.MAILBOX_SLOTS)
+metrics.REGISTRY.gauge("active_sessions", "Connected Socket.IO sessions", callback=lambda: len(sessions))
+
+@socketio.on("connect")
+def handle_connect(auth=None):
+    # 前端同一页面的多个连接携带相同 channel，共享一个结果房间
+    auth = auth or {}
+    channel = auth.get("channel") or request.sid
+    join_room(channel)
+    sessions.open(request.sid, channel, auth)
+
+@socketio.on("disconnect")
+def handle_disconnect(*args):
+    sessions.close(request.sid)
+
+def consume_frames(session):
+    # 每个会话一个消费协程：总是取信箱里最新的一帧
+    while True:
+        frame = session.mailbox.get()
+        if frame is None or session.closed:
+            break
+        image_data, seq = frame
+        try:
+            start = time.perf_counter()
+            detector = session.detector
+            detector.seq = seq
+            detector.process_frame(detector.decoder.decode(image_data))
+            session.flow.observe(time.perf_counter() - start)
+        except Exception as e:
+            ERRORS.inc()
+            print("[ERROR] Frame decode failed:", repr(e))
 
 @socketio.on("frame")
 def handle_frame(data):
-    try:
-        if hasattr(data, "read"):
-            image_data = data.read()
-        else:
-            image_data = data
-        img = Image.open(BytesIO(image_data))
-        frame = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-        detector.process_frame(frame)
-    except Exception as e:
-        print("[ERROR] Frame decode failed:", e)
+    session = sessions.get(request.sid)
+    if session is None:
+        # 已断开（或从未连接）的 sid
+        return
+    image_data, seq = unpack_frame(data)
+    if config.RECORD_DIR:
+        with STAGE_SECONDS.time(stage="record"):
+            session.record(image_data, config.RECORD_DIR)
+    session.mailbox.put((image_data, seq))
+    if session.consumer is None:
+        session.consumer = socketio.start_background_task(consume_frames, session)
+    if config.FLOW_CONTROL:
+        # 只发给发送帧的这条连接，而不是整个 channel
+        recommendation = session.flow.update()
+        if recommendation is not None:
+            socketio.emit("flow_control", recommendation, to=request.sid)
 
 @app.route("/start_calibration", methods=["POST"])
 def start_calibration():
-    detector.calibrating = True
-    detector.ratios.clear()
-    detector.min_ratio = float("inf")
-    detector.max_ratio = float("-inf")
+    # 只重新校准指定 channel（一个页面）的会话，不影响其他玩家
+    channel = request.args.get("channel") or (request.get_json(silent=True) or {}).get("channel")
+    if not channel:
+        return {"error": "channel is required"}, 400
+    sessions.start_calibration(channel)
     return {"status": "calibrating"}
 
+@app.route("/stats")
+def stats():
+    # 每个会话的收帧/处理/丢帧数与排队等待时间
+    return {"sessions": [session.stats() for session in sessions]}
+
+@app.route("/metrics")
+def metrics_route():
+    # Prometheus 文本格式：各阶段耗时直方图、帧计数、会话数与消息数
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.before_request
+def start_warm_up():
+    # 不经过 __main__ 启动时，第一个 HTTP 请求开始预热
+    STARTUP.start(socketio.start_background_task, inference_pool.warm_up)
+
 @app.route("/")
 def index():
-    return {"status": "backend is live"}
+    # 预热完成前返回 503，健康检查据此判断能否接流量；同时报告各启动阶段耗时
+    report = STARTUP.report()
+    if not STARTUP.ready:
+        return dict(report, status="warming up"), 503
+    return dict(report, status="backend is live")
+
+STARTUP.record("import", time.perf_counter() - _import_started)
 
 if __name__ == "__main__":
-    socketio.run(app, host="0.0.0.0", port=5000, debug=True, use_reloader=False)
+    # 启动推理进程并在空白帧上预热，期间服务已经可以接受连接
+    STARTUP.start(socketio.start_background_task, inference_pool.warm_up)
+    socketio.run(app, host="0.0.0.0", port=config.PORT, debug=True, use_reloader=False)
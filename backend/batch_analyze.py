@@ -0,0 +1,206 @@
+import argparse
+import itertools
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+import geometry
+from decoder import FrameDecoder
+from earm import EarmBlinkDetector
+from framelog import MAGIC, frame_offsets, read_frames
+
+# 离线批量分析：把录制的视频 / 帧录制文件 / 图片目录切成若干段，分给进程池并行做 FaceMesh 推理，
+# 每个进程各持有一个 FaceMesh；推理结果按输入拼回完整序列后，再顺序计算状态与眨眼（这一步很便宜）
+# 每个输入输出一个 NPZ：逐帧 EAR / 张嘴比例 / EARM、左右眼与双眼的闭眼状态、眨眼帧序号
+# 用法：python batch_analyze.py a.mp4 b.ebgf frames_dir/ --output results/ [--workers 8] [--chunk 300]
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+_runner = None
+
+
+def _init_worker(options):
+    global _runner
+    from inference import FaceMeshRunner
+    _runner = FaceMeshRunner(**options)
+
+
+def _kind(path):
+    if os.path.isdir(path):
+        return "dir"
+    with open(path, "rb") as f:
+        return "ebgf" if f.read(len(MAGIC)) == MAGIC else "video"
+
+
+def _dir_frames(path):
+    return sorted(os.path.join(path, name) for name in os.listdir(path)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def index_frames(path, kind):
+    # 返回 (帧数, 每帧的字节偏移)；只有录制文件有偏移，各段直接 seek 到起始帧，不必从头读
+    if kind == "dir":
+        return len(_dir_frames(path)), None
+    if kind == "ebgf":
+        offsets = frame_offsets(path)
+        return len(offsets), offsets
+    cap = cv2.VideoCapture(path)
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return count, None
+
+
+def _read_chunk(path, kind, start, count, offset=None):
+    # 逐帧产出 (时间戳, RGB)
+    if kind == "dir":
+        for name in _dir_frames(path)[start:start + count]:
+            yield None, cv2.cvtColor(cv2.imread(name), cv2.COLOR_BGR2RGB)
+    elif kind == "ebgf":
+        decoder = FrameDecoder("rgb")
+        for timestamp, data in itertools.islice(read_frames(path, offset), count):
+            yield timestamp, decoder.decode(data)
+    else:
+        cap = cv2.VideoCapture(path)
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        try:
+            for _ in range(count):
+                success, frame = cap.read()
+                if not success:
+                    return
+                yield cap.get(cv2.CAP_PROP_POS_MSEC) / 1000, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        finally:
+            cap.release()
+
+
+def analyze_chunk(path, kind, start, count, offset=None):
+    # 工作进程：返回 (start, 时间戳, (帧数, 4) 的 LEFT / RIGHT / AVG / MOUTH，没有人脸的帧为 NaN)
+    key = "%s:%d" % (path, start)
+    timestamps = []
+    ratios = []
+    try:
+        for timestamp, rgb in _read_chunk(path, kind, start, count, offset):
+            faces = _runner.process(key, rgb)
+            timestamps.append(np.nan if timestamp is None else timestamp)
+            ratios.append(geometry.face_ratios(faces[0]) if faces is not None else np.full(4, np.nan))
+    finally:
+        # 每段从头开始跟踪，不把上一段的跟踪状态带到不相邻的帧
+        _runner.release(key)
+    return start, np.array(timestamps, dtype=np.float64), np.array(ratios, dtype=np.float32).reshape(-1, 4)
+
+
+def closed_runs(closed, min_frames=3):
+    # 连续闭眼至少 min_frames 帧、随后睁眼，记为一次眨眼（与 app.py 的 counter > 2 一致）
+    # 返回睁眼那一帧的序号
+    padded = np.concatenate(([False], closed, [False])).astype(np.int8)
+    edges = np.diff(padded)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    lengths = ends - starts
+    ends = ends[(lengths >= min_frames) & (ends < len(closed))]
+    return ends
+
+
+def earm_series(ear, window_size=11):
+    # 居中的 EARM（离线时可以看到未来的帧），窗口不完整的位置为 NaN
+    o = (window_size + 1) // 2
+    earm = np.full(len(ear), np.nan)
+    if len(ear) > 2 * o:
+        t = np.arange(o, len(ear) - o)
+        earm[t] = ear[t - o] + ear[t - o + 1] + ear[t + o - 1] + ear[t + o] - 4 * ear[t]
+    return earm
+
+
+def analyze_series(ratios, threshold=None, calibration_frames=100):
+    # 在完整序列上计算状态与眨眼；threshold 为空时按 app.py 的方式用前 calibration_frames 个有效帧校准
+    face = ~np.isnan(ratios[:, geometry.AVG])
+    valid = ratios[face]
+    if threshold is None:
+        sample = valid[:calibration_frames, geometry.AVG]
+        threshold = float(sample.min() + (sample.max() - sample.min()) * 0.4) if len(sample) else 0.3
+    # 与实时检测一样跳过没有人脸的帧：状态只在有人脸的帧上计算，其余帧沿用上一个有人脸的帧
+    frames = np.flatnonzero(face)
+    valid_closed = valid[:, :3] < threshold
+    position = face.cumsum() - 1
+    seen = position >= 0
+    closed = np.zeros((len(face), 3), dtype=bool)
+    closed[seen] = valid_closed[position[seen]]
+
+    earm = np.full(len(face), np.nan, dtype=np.float32)
+    earm[frames] = earm_series(valid[:, geometry.AVG])
+    earm_detector = EarmBlinkDetector(mode="causal")
+    earm_blinks = []
+    for index, ear in zip(frames, valid[:, geometry.AVG].tolist()):
+        _, events = earm_detector.update(ear)
+        if any(name == "blink_event" for name, _ in events):
+            earm_blinks.append(index)
+
+    return {
+        "threshold": np.float32(threshold),
+        "face": face,
+        "left_closed": closed[:, geometry.LEFT],
+        "right_closed": closed[:, geometry.RIGHT],
+        "closed": closed[:, geometry.AVG],
+        "blinks": frames[closed_runs(valid_closed[:, geometry.AVG])],
+        "left_blinks": frames[closed_runs(valid_closed[:, geometry.LEFT])],
+        "right_blinks": frames[closed_runs(valid_closed[:, geometry.RIGHT])],
+        "earm": earm,
+        "earm_blinks": np.array(earm_blinks, dtype=np.int64),
+    }
+
+
+def analyze(inputs, output, workers=None, chunk=300, threshold=None, options=None):
+    options = options or dict(max_num_faces=1, min_detection_confidence=0.5, min_tracking_confidence=0.5)
+    os.makedirs(output, exist_ok=True)
+    jobs = []
+    for path in inputs:
+        kind = _kind(path)
+        total, offsets = index_frames(path, kind)
+        jobs.append((path, kind, total, offsets))
+
+    ctx = multiprocessing.get_context("spawn")
+    summary = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                             initializer=_init_worker, initargs=(options,)) as pool:
+        futures = {path: [pool.submit(analyze_chunk, path, kind, start, min(chunk, total - start),
+                                      offsets[start] if offsets else None)
+                          for start in range(0, total, chunk)]
+                   for path, kind, total, offsets in jobs}
+        for path, kind, total, offsets in jobs:
+            parts = sorted(future.result() for future in futures[path])
+            timestamps = np.concatenate([p[1] for p in parts]) if parts else np.empty(0)
+            ratios = np.concatenate([p[2] for p in parts]) if parts else np.empty((0, 4), np.float32)
+            result = analyze_series(ratios, threshold)
+            name = os.path.splitext(os.path.basename(os.path.normpath(path)))[0]
+            np.savez_compressed(os.path.join(output, name + ".npz"), time=timestamps,
+                                ear_left=ratios[:, geometry.LEFT], ear_right=ratios[:, geometry.RIGHT],
+                                ear=ratios[:, geometry.AVG], mouth=ratios[:, geometry.MOUTH], **result)
+            summary.append((path, len(ratios), int(result["face"].sum()), len(result["blinks"]),
+                            len(result["earm_blinks"])))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch EAR / blink analysis of recorded sessions")
+    parser.add_argument("inputs", nargs="+", help="video files, frame recordings (.ebgf) or image directories")
+    parser.add_argument("--output", required=True, help="directory for the per-input .npz files")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--chunk", type=int, default=300, help="frames per task")
+    parser.add_argument("--threshold", type=float, help="fixed EAR threshold instead of calibrating")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    summary = analyze(args.inputs, args.output, args.workers, args.chunk, args.threshold)
+    elapsed = time.perf_counter() - start
+    frames = sum(s[1] for s in summary)
+    for path, count, faces, blinks, earm_blinks in summary:
+        print("%s: %d frames, %d with face, %d blinks (EAR), %d blinks (EARM)" %
+              (path, count, faces, blinks, earm_blinks))
+    print("%d frames in %.2fs, %.1f fps" % (frames, elapsed, frames / elapsed if elapsed else 0.0))
+
+
+if __name__ == "__main__":
+    main()
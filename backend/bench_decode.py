@@ -0,0 +1,87 @@
+import argparse
+import time
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from decoder import FrameDecoder
+
+# 解码路径微基准：旧路径（PIL -> np.array -> RGB2BGR -> BGR2RGB）与 FrameDecoder 对比
+# 用法：python bench_decode.py [--image face.jpg] [--repeat 200]
+
+RESOLUTIONS = {"480p": (640, 480), "720p": (1280, 720)}
+
+
+def legacy_decode(data):
+    img = Image.open(BytesIO(data))
+    frame = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def legacy_decode_gray(data):
+    img = Image.open(BytesIO(data))
+    frame = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+
+def synthetic_frame(width, height):
+    # 渐变背景加随机色块，压缩率接近真实摄像头画面
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frame = np.dstack([(x + y) / 2, np.broadcast_to(x, (height, width)), np.broadcast_to(y, (height, width))])
+    frame = frame.astype(np.uint8)
+    for _ in range(40):
+        cx, cy = rng.integers(0, width), rng.integers(0, height)
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        cv2.circle(frame, (int(cx), int(cy)), int(rng.integers(10, 80)), color, -1)
+    noise = rng.integers(-8, 8, frame.shape, dtype=np.int16)
+    return np.clip(frame.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def encode(frame, quality):
+    # 与前端 canvas.toBlob("image/jpeg", 0.6) 的质量一致
+    _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
+
+
+def bench(fn, data, repeat):
+    fn(data)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn(data)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="JPEG decode path micro-benchmark")
+    parser.add_argument("--image", help="use this image (resized) instead of a synthetic frame")
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--quality", type=int, default=60)
+    args = parser.parse_args()
+
+    source = cv2.imread(args.image) if args.image else None
+    for name, (width, height) in RESOLUTIONS.items():
+        frame = cv2.resize(source, (width, height)) if source is not None else synthetic_frame(width, height)
+        data = encode(frame, args.quality)
+        cases = [
+            ("legacy rgb", legacy_decode),
+            ("decoder rgb", FrameDecoder("rgb").decode),
+            ("decoder rgb 1/2", FrameDecoder("rgb", 2).decode),
+            ("legacy gray", legacy_decode_gray),
+            ("decoder gray", FrameDecoder("gray").decode),
+            ("decoder gray 1/2", FrameDecoder("gray", 2).decode),
+        ]
+        print("%s (%dx%d, %d KB)" % (name, width, height, len(data) // 1024))
+        baseline = None
+        for label, fn in cases:
+            ms = bench(fn, data, args.repeat)
+            if label.startswith("legacy"):
+                baseline = ms
+            print("  %-18s %7.3f ms  x%.2f" % (label, ms, baseline / ms))
+
+
+if __name__ == "__main__":
+    main()
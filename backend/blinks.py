@@ -0,0 +1,73 @@
+import numpy as np
+
+import geometry
+
+# 眨眼状态机：所有人脸、所有通道（双眼平均 / 左眼 / 右眼 ...）的计数与状态放在数组里，
+# 每帧一次调用同时更新，只返回发生变化的通道
+# 通道值低于阈值为闭眼；连续闭眼至少 min_frames 帧后睁眼记为一次眨眼（对应旧代码的 counter > 2）
+
+# 通道名 -> (状态事件, 眨眼事件)，与旧版逐事件消息的名字一致
+CHANNEL_EVENTS = {
+    "avg": ("eye_state", "blink_event"),
+    "left": ("left_eye_state", "left_blink_event"),
+    "right": ("right_eye_state", "right_blink_event"),
+}
+
+# 默认通道及其在 geometry.face_ratios 结果里的列；通道顺序即同一帧内事件的顺序
+CHANNELS = ("avg", "left", "right")
+COLUMNS = [geometry.AVG, geometry.LEFT, geometry.RIGHT]
+
+# 转换类型
+CLOSED, OPEN, BLINK = "closed", "open", "blink"
+
+
+class BlinkStates:
+    __slots__ = ("channels", "min_frames", "counters", "totals", "closed")
+
+    def __init__(self, faces=1, channels=CHANNELS, min_frames=3):
+        self.channels = tuple(channels)
+        # 每个通道各自的最少闭眼帧数，可以传一个数或按通道的序列
+        self.min_frames = np.broadcast_to(np.asarray(min_frames, dtype=np.int32), (len(self.channels),)).copy()
+        shape = (faces, len(self.channels))
+        self.counters = np.zeros(shape, dtype=np.int32)
+        self.totals = np.zeros(shape, dtype=np.int32)
+        self.closed = np.zeros(shape, dtype=bool)
+
+    def update(self, values, thresholds, rows=None):
+        # values: (n, 通道数)，thresholds: 标量、(n,) 或 (n, 通道数)；rows 为这 n 行对应的人脸编号，默认 0..n-1
+        # 返回 [(人脸, 通道序号, 转换类型, 眨眼总数)]，按人脸、通道排序；
+        # 同一通道内的顺序与旧代码一致：先眨眼再睁眼
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(self.channels))
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        if thresholds.ndim == 1:
+            thresholds = thresholds[:, None]
+        rows = np.arange(len(values)) if rows is None else np.asarray(rows, dtype=np.intp)
+
+        was_closed = self.closed[rows]
+        counters = self.counters[rows]
+        is_closed = values < thresholds
+        blinks = ~is_closed & (counters >= self.min_frames)
+        totals = self.totals[rows] + blinks
+        self.totals[rows] = totals
+        self.counters[rows] = np.where(is_closed, counters + 1, 0)
+        self.closed[rows] = is_closed
+
+        transitions = []
+        for i, c in np.argwhere(blinks | (is_closed != was_closed)).tolist():
+            face = int(rows[i])
+            if blinks[i, c]:
+                transitions.append((face, c, BLINK, int(totals[i, c])))
+            if is_closed[i, c] != was_closed[i, c]:
+                transitions.append((face, c, CLOSED if is_closed[i, c] else OPEN, int(totals[i, c])))
+        return transitions
+
+    def events(self, transitions):
+        # 转换 -> [(人脸, 事件名, 数据)]，数据格式与旧版事件相同
+        events = []
+        for face, c, kind, total in transitions:
+            state_event, blink_event = CHANNEL_EVENTS[self.channels[c]]
+            if kind == BLINK:
+                events.append((face, blink_event, {"total": total}))
+            else:
+                events.append((face, state_event, {"status": kind}))
+        return events
@@ -0,0 +1,64 @@
+import eventlet.green.threading as threading
+
+from metrics import REGISTRY
+
+# MJPEG 视频流广播：采集循环每个新帧只编码、发布一次，任意多个观看者各自取最新帧
+# 网络写入在锁外进行，慢的观看者只会跳过自己没来得及发送的帧，不会拖慢采集
+
+STREAM_FRAMES_SKIPPED = REGISTRY.counter("stream_frames_skipped_total",
+                                         "Frames a /video_feed viewer skipped because it was still sending")
+
+
+class FrameBroadcaster:
+    def __init__(self, boundary=b"frame"):
+        self.boundary = boundary
+        self.cond = threading.Condition()
+        self.part = None
+        self.seq = 0
+        self.viewers = 0
+        self.closed = False
+        REGISTRY.gauge("stream_viewers", "Connected /video_feed viewers", callback=lambda: self.viewers)
+
+    @property
+    def has_viewers(self):
+        return self.viewers > 0
+
+    def publish(self, jpeg):
+        # multipart 分段在这里拼好一次，所有观看者共享同一个 bytes 对象
+        part = b"--" + self.boundary + b"\r\nContent-Type: image/jpeg\r\n\r\n" + jpeg + b"\r\n"
+        with self.cond:
+            self.part = part
+            self.seq += 1
+            self.cond.notify_all()
+
+    def open(self):
+        with self.cond:
+            self.closed = False
+
+    def close(self):
+        # 结束所有观看者的流
+        with self.cond:
+            self.closed = True
+            self.part = None
+            self.cond.notify_all()
+
+    def stream(self):
+        # 每个观看者一个生成器：等到有比上次发送更新的帧才醒来，从不重复发送同一帧
+        with self.cond:
+            self.viewers += 1
+        try:
+            seen = self.seq
+            while True:
+                with self.cond:
+                    while self.seq == seen and not self.closed:
+                        self.cond.wait()
+                    if self.closed:
+                        return
+                    if self.seq - seen > 1:
+                        STREAM_FRAMES_SKIPPED.inc(self.seq - seen - 1)
+                    seen = self.seq
+                    part = self.part
+                yield part
+        finally:
+            with self.cond:
+                self.viewers -= 1
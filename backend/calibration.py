@@ -0,0 +1,265 @@
+import argparse
+import random
+import sys
+
+# 恒定内存的流式 EAR 阈值校准：不保存原始比值。睁眼的样本用来跟踪中心、离散程度和高分位（睁眼水平），
+# 眨眼（远低于中心的一小段）的最低点单独用来跟踪闭眼水平；阈值 = 低 + (高 - 低) * ratio，对应旧的 min + (max - min) * 0.4
+# 闭眼水平离睁眼很远而眨眼帧又很少，低分位的随机梯度估计要几千帧才能跟过去，所以两种样本分开估计
+# 每次（重新）估计睁眼分布的前 frames 帧用较大的步长快速收敛，之后以 rate 的小步长持续跟踪缓慢的漂移；
+# 睁眼水平突然下降（光照变化、离镜头远了）时低于中心的一段会持续很久，这时从新的样本重新估计
+# 校准期间检测照常进行：首轮校准结束（至少 frames 帧且见过一次眨眼）前使用 baseline 阈值，之后每帧使用最新的估计
+# python calibration.py 在合成的 EAR 序列上跑几种场景（稳定、睁眼水平突降、半闭眼扫视、重新校准），作为回归检查
+
+
+# 分位数更新的步长：相对于样本离散程度的倍数
+GAIN = 200
+# 连续 DIP_FRAMES 帧低于中心 DIP 倍离散程度算作一次眨眼（眨眼至少持续 3 帧，单帧噪声不算）
+# 开始的 DIP_WARMUP 帧离散程度还不可靠，不做判断
+DIP = 6
+DIP_FRAMES = 3
+DIP_WARMUP = 30
+# 眨眼不到 0.5 秒；低于中心超过 MAX_DIP_FRAMES 帧当作睁眼水平整体下降，重新估计睁眼分布
+MAX_DIP_FRAMES = 15
+# 闭眼水平的最小更新步长（按眨眼次数计），约等于记住最近几次眨眼
+DIP_RATE = 0.2
+# 从档案恢复后用前 VERIFY_FRAMES 帧检查保存的睁眼中心：落在附近的不到 VERIFY_NEAR 时档案已不适用，重新走首轮校准
+VERIFY_FRAMES = 30
+VERIFY_NEAR = 20
+
+
+def _quantile_step(estimate, value, q, eta):
+    # 随机梯度分位数：样本在估计之上时上移 eta * q，之下时下移 eta * (1 - q)，
+    # 每步都不越过样本本身，步长取得大也不会来回震荡
+    if value < estimate:
+        return max(estimate - eta * (1 - q), value)
+    return min(estimate + eta * q, value)
+
+
+class StreamingCalibration:
+    __slots__ = ("baseline", "frames", "rate", "high_q", "ratio", "count", "seen", "below", "trough", "dips",
+                 "center", "spread", "low", "high", "threshold", "calibrating", "calibrated", "announce",
+                 "reference", "verify", "near")
+
+    def __init__(self, baseline=0.2, frames=100, rate=0.001, high_q=0.98, ratio=0.4):
+        self.baseline = baseline
+        self.frames = frames
+        self.rate = rate
+        self.high_q = high_q
+        self.ratio = ratio
+        self._reset()
+
+    def _reset(self):
+        # 回到首轮校准之前
+        # seen：累计样本数，不随重新校准清零
+        self.seen = 0
+        # 累计的眨眼次数；闭眼水平：见到第一次眨眼前为 None
+        self.dips = 0
+        self.low = None
+        self.threshold = self.baseline
+        self.calibrating = True
+        # 首轮校准完成（或从档案恢复）后阈值才跟随估计
+        self.calibrated = False
+        # 刚从档案恢复，下一帧要通知一次 calibrated
+        self.announce = False
+        # 从档案恢复的 (中心, 离散程度)、还要检查的帧数与其中落在中心附近的帧数
+        self.reference = None
+        self.verify = 0
+        self.near = 0
+        self._seed()
+
+    def _seed(self, value=None):
+        # 从 value（或下一个样本）开始重新估计睁眼分布；闭眼水平保留
+        # count：这次估计用过的样本数，前 frames 个用较大的步长
+        self.count = 0 if value is None else 1
+        self.center = self.high = value
+        # 与中心的平均绝对偏差，作为分位数更新的步长尺度和判断眨眼的尺度
+        self.spread = 0.0
+        # 当前这段连续低于中心的帧数和最低点
+        self.below = 0
+        self.trough = None
+
+    def restart(self):
+        # 重新校准：睁眼分布从接下来的样本重新估计，闭眼水平保留，阈值不回到 baseline
+        self._seed()
+        self.calibrating = True
+
+    def state(self):
+        # 可以存进档案的估计值；首轮校准还没完成时返回 None
+        if not self.calibrated or self.low is None or self.center is None:
+            return None
+        return {"threshold": self.threshold, "center": self.center, "spread": self.spread,
+                "low": self.low, "high": self.high, "seen": self.seen, "dips": self.dips}
+
+    def restore(self, state):
+        # 从档案恢复：直接使用保存的阈值检测，不再走首轮校准
+        self._seed()
+        self.center = state["center"]
+        self.spread = state["spread"]
+        self.low = state["low"]
+        self.high = state["high"]
+        self.threshold = state["threshold"]
+        self.count = self.frames
+        self.seen = max(state.get("seen", 0), self.frames)
+        self.dips = state.get("dips", 0)
+        self.calibrating = False
+        self.calibrated = True
+        self.announce = True
+        self.reference = (self.center, self.spread)
+        self.verify = VERIFY_FRAMES
+        self.near = 0
+
+    def _check_profile(self, value):
+        # 档案恢复后的前几帧大多应当落在保存的睁眼中心附近（眨眼的帧不多）；
+        # 光照、位置变了很多时档案已不适用，丢掉它从头校准，而不是在错的估计上慢慢修正
+        center, spread = self.reference
+        self.verify -= 1
+        if abs(value - center) <= DIP * spread:
+            self.near += 1
+        if not self.verify and self.near < VERIFY_NEAR:
+            self._reset()
+
+    def _dip(self, trough):
+        # 一次眨眼的最低点：必须明显更接近闭眼水平而不是睁眼中心（第一次眨眼要低于 baseline），
+        # 半闭眼的扫视、低头不算
+        limit = (self.low + self.center) / 2 if self.low is not None else self.baseline
+        if trough >= limit:
+            return
+        self.dips += 1
+        if self.low is None:
+            self.low = trough
+        else:
+            self.low += max(DIP_RATE, 1.0 / self.dips) * (trough - self.low)
+
+    def update(self, value):
+        # 返回本帧是否需要发 calibrated：一轮校准刚结束，或刚从档案恢复
+        if self.verify:
+            self._check_profile(value)
+        self.count += 1
+        self.seen += 1
+        if self.center is None:
+            self.center = self.high = value
+        elif self.count > DIP_WARMUP and value < self.center - DIP * self.spread:
+            # 远低于中心的样本不计入睁眼的分布，记下这一段的最低点，这一段结束时再判断是不是眨眼
+            self.below += 1
+            self.trough = value if self.trough is None else min(self.trough, value)
+            if self.below > MAX_DIP_FRAMES:
+                # 持续太久不是眨眼，是睁眼水平整体下降了
+                self._seed(value)
+        else:
+            if self.below >= DIP_FRAMES:
+                self._dip(self.trough)
+            self.below = 0
+            self.trough = None
+            # 快速收敛阶段步长约 1 / n，之后固定为 rate
+            step = max(self.rate, 1.0 / self.count) if self.count < self.frames else self.rate
+            self.center += step * (value - self.center)
+            self.spread += step * (abs(value - self.center) - self.spread)
+            self.high = _quantile_step(self.high, value, self.high_q, step * self.spread * GAIN)
+
+        # 没见过眨眼时不结束首轮：只有睁眼水平定不出阈值，继续用 baseline
+        finished = self.calibrating and self.count >= self.frames and self.low is not None
+        if finished:
+            self.calibrating = False
+            self.calibrated = True
+        if self.calibrated:
+            self.threshold = self.low + (self.high - self.low) * self.ratio
+        announce, self.announce = self.announce, False
+        return finished or announce
+
+
+def synthetic(open_level, frames, rng, blink_every=90, blink_frames=4, glance_every=0, glance_frames=30,
+              glance_level=0.8, noise=0.012, closed=0.4):
+    # 合成的 EAR 序列：open_level(i) 为第 i 帧的睁眼水平；眨眼为睁眼水平的 closed 倍，
+    # 扫视（半闭眼）为 glance_level 倍；返回 (样本, 眨眼区间)
+    values = []
+    blinks = []
+    for i in range(frames):
+        level = open_level(i)
+        if blink_every and i % blink_every >= blink_every - blink_frames:
+            if i % blink_every == blink_every - blink_frames:
+                blinks.append((i, i + blink_frames))
+            level *= closed
+        elif glance_every and i % glance_every < glance_frames and i >= glance_every:
+            level *= glance_level
+        values.append(rng.gauss(level, noise))
+    return values, blinks
+
+
+def detect(calibration, values, min_frames=3):
+    # 与 blinks.BlinkStates 相同的规则：连续 min_frames 帧低于阈值再睁眼记为一次眨眼；返回闭眼区间
+    runs = []
+    start = None
+    for i, value in enumerate(values):
+        calibration.update(value)
+        if value < calibration.threshold:
+            if start is None:
+                start = i
+        else:
+            if start is not None and i - start >= min_frames:
+                runs.append((start, i))
+            start = None
+    return runs
+
+
+def score(runs, blinks, since=0):
+    # (检出的眨眼数, 眨眼总数, 不对应任何眨眼的闭眼次数)，只统计 since 帧之后的
+    blinks = [b for b in blinks if b[0] >= since]
+    runs = [r for r in runs if r[0] >= since]
+    found = sum(1 for b in blinks if any(r[0] < b[1] and b[0] < r[1] for r in runs))
+    spurious = sum(1 for r in runs if not any(r[0] < b[1] and b[0] < r[1] for b in blinks))
+    return found, len(blinks), spurious
+
+
+def scenarios(seed=1):
+    # 各场景：(名字, 检出, 总数, 误报)；30 fps，每 3 秒眨眼一次，共 5 分钟
+    rng = random.Random(seed)
+    results = []
+
+    values, blinks = synthetic(lambda i: 0.30, 9000, rng)
+    results.append(("steady",) + score(detect(StreamingCalibration(), values), blinks))
+
+    # 第 1 分钟末光照变化，睁眼 EAR 从 0.30 一步降到 0.22
+    values, blinks = synthetic(lambda i: 0.30 if i < 1800 else 0.22, 9000, rng)
+    results.append(("step drop",) + score(detect(StreamingCalibration(), values), blinks, since=1800))
+
+    # 每 10 秒低头看一眼（1 秒，EAR 降到 0.24），不应当算作眨眼；噪声小时睁眼分布窄，扫视最容易被当成闭眼
+    values, blinks = synthetic(lambda i: 0.30, 9000, rng, glance_every=300, noise=0.008)
+    results.append(("glances",) + score(detect(StreamingCalibration(), values), blinks))
+
+    # 睁眼水平降到 0.20 时重新校准
+    calibration = StreamingCalibration()
+    values, blinks = synthetic(lambda i: 0.30 if i < 3000 else 0.20, 6000, rng)
+    runs = detect(calibration, values[:3000])
+    calibration.restart()
+    runs += [(start + 3000, end + 3000) for start, end in detect(calibration, values[3000:])]
+    results.append(("restart",) + score(runs, blinks, since=3000))
+
+    # 睁眼 0.30 时保存的档案，回来时睁眼只有 0.22，连接时又请求了重新校准
+    calibration = StreamingCalibration()
+    values, _ = synthetic(lambda i: 0.30, 3000, rng)
+    detect(calibration, values)
+    restored = StreamingCalibration()
+    restored.restore(calibration.state())
+    restored.restart()
+    values, blinks = synthetic(lambda i: 0.22, 5400, rng)
+    results.append(("stale profile",) + score(detect(restored, values), blinks, since=300))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the streaming calibration on synthetic EAR series")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--min-recall", type=float, default=0.95, help="fraction of blinks that must be detected")
+    parser.add_argument("--max-spurious", type=int, default=2, help="closures allowed that match no blink")
+    args = parser.parse_args()
+
+    failed = False
+    for name, found, total, spurious in scenarios(args.seed):
+        ok = found >= total * args.min_recall and spurious <= args.max_spurious
+        failed |= not ok
+        print("%-13s %3d/%d blinks detected, %d spurious  %s" % (name, found, total, spurious, "ok" if ok else "FAIL"))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
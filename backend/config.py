@@ -0,0 +1,62 @@
+import os
+
+# 后端可调参数，均可通过环境变量覆盖
+
+
+def _env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+
+# 推理工作进程数（0 表示在服务进程内直接推理）
+INFERENCE_WORKERS = _env_int("INFERENCE_WORKERS", max(1, (os.cpu_count() or 2) - 1))
+# 每个工作进程同时在途的帧数
+INFERENCE_INFLIGHT = _env_int("INFERENCE_INFLIGHT", 2)
+# 裁剪推理：>0 时只在上一帧人脸框附近的裁剪区域上推理，并缩放到该长边；0 为整帧推理
+CROP_SIDE = _env_int("CROP_SIDE", 0)
+# 裁剪框在人脸框四周额外留出的比例
+CROP_PAD = float(os.environ.get("CROP_PAD", "0.4"))
+# dlib：每隔多少帧做一次 HOG 人脸检测，其间用跟踪代替
+DLIB_DETECT_INTERVAL = _env_int("DLIB_DETECT_INTERVAL", 10)
+# dlib：检测之间的人脸框来源，correlation（相关滤波跟踪）或 reuse（沿用上一帧）
+DLIB_TRACKER = os.environ.get("DLIB_TRACKER", "correlation")
+# dlib：相关滤波跟踪的最低置信度（PSR），低于它立即重新检测
+DLIB_MIN_PSR = float(os.environ.get("DLIB_MIN_PSR", "7.0"))
+# dlib：检测前 pyrDown 的层数
+DLIB_DETECT_PYRAMID = _env_int("DLIB_DETECT_PYRAMID", 0)
+# 非空时把每个会话收到的帧录制到该目录（<sid>.ebgf），供 replay.py 回放
+RECORD_DIR = os.environ.get("RECORD_DIR", "")
+# 每个会话的帧信箱容量（1 即只保留最新一帧）
+MAILBOX_SLOTS = _env_int("MAILBOX_SLOTS", 1)
+# 客户端未指定时使用的结果消息格式：frame_result / legacy / both
+EVENT_MODE = os.environ.get("EVENT_MODE", "legacy")
+# JPEG 解码缩放（1 / 2 / 4 / 8），大于 1 时在解码阶段直接缩小
+DECODE_SCALE = _env_int("DECODE_SCALE", 1)
+# EARM 求值位置：center（历史中点，旧行为）或 causal（最新的完整窗口，滞后最小）
+EARM_MODE = os.environ.get("EARM_MODE", "center")
+# app.py 客户端未指定时使用的眨眼判定方法：ear（EAR 阈值）或 earm（EARM 滤波）
+BLINK_METHOD = os.environ.get("BLINK_METHOD", "ear")
+# earm_detect 的 /video_feed 调试叠加层：none / contours / full
+OVERLAY = os.environ.get("OVERLAY", "full")
+# 是否向发送帧的客户端推送 flow_control（推荐帧率 / 分辨率 / JPEG 质量）
+FLOW_CONTROL = _env_int("FLOW_CONTROL", 1) != 0
+# 推荐帧率的上下限
+FLOW_MAX_FPS = _env_int("FLOW_MAX_FPS", 30)
+FLOW_MIN_FPS = _env_int("FLOW_MIN_FPS", 5)
+# 重新评估推荐值的间隔（秒）
+FLOW_INTERVAL = float(os.environ.get("FLOW_INTERVAL", "1.0"))
+# 本地多人模式：一个画面里最多允许的玩家（人脸）数，客户端通过 auth 的 players 选择
+MAX_PLAYERS = _env_int("MAX_PLAYERS", 4)
+# EAR 阈值校准：首轮校准结束前使用的默认阈值、快速收敛的帧数、之后持续跟踪漂移的步长
+EAR_BASELINE = float(os.environ.get("EAR_BASELINE", "0.2"))
+CALIBRATION_FRAMES = _env_int("CALIBRATION_FRAMES", 100)
+CALIBRATION_RATE = float(os.environ.get("CALIBRATION_RATE", "0.001"))
+# 用户校准档案的保存目录（为空则不保存）与内存中缓存的档案数；默认在本模块旁边，与启动时的工作目录无关
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"))
+PROFILE_CACHE = _env_int("PROFILE_CACHE", 256)
+# 服务监听端口（serve.py 多进程部署时为每个服务进程分别指定）
+PORT = _env_int("PORT", 5000)
+# 多进程部署时各服务进程共享的消息队列：unix:///path 为 serve.py 启动的本机代理，也可以是 redis:// 等；为空则单进程
+MESSAGE_QUEUE = os.environ.get("MESSAGE_QUEUE", "")
+# 是否收集 /metrics 指标（0 关闭，关闭后计时与计数都是空操作）
+METRICS = _env_int("METRICS", 1) != 0
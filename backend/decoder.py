@@ -0,0 +1,48 @@
+import cv2
+import numpy as np
+
+from metrics import STAGE_SECONDS
+
+# JPEG 解码：直接用 cv2.imdecode 解到目标格式，最多做一次颜色转换
+# scale 为 2 / 4 / 8 时由 libjpeg 在解码阶段直接缩小，比先解码再 resize 便宜得多
+_FLAGS = {
+    ("rgb", 1): cv2.IMREAD_COLOR,
+    ("rgb", 2): cv2.IMREAD_REDUCED_COLOR_2,
+    ("rgb", 4): cv2.IMREAD_REDUCED_COLOR_4,
+    ("rgb", 8): cv2.IMREAD_REDUCED_COLOR_8,
+    ("gray", 1): cv2.IMREAD_GRAYSCALE,
+    ("gray", 2): cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    ("gray", 4): cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    ("gray", 8): cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+# OpenCV 4.10+ 可以直接解码成 RGB，省掉唯一的那次转换
+_IMREAD_COLOR_RGB = getattr(cv2, "IMREAD_COLOR_RGB", None)
+
+
+class FrameDecoder:
+    # mode: "rgb"（MediaPipe）或 "gray"（dlib）
+    # 返回的 RGB 数组是复用的预分配缓冲区，下一次 decode 会覆盖它，调用方需在此之前用完
+    def __init__(self, mode="rgb", scale=1):
+        if (mode, scale) not in _FLAGS:
+            raise ValueError("unsupported decode mode/scale: %s/%s" % (mode, scale))
+        self.mode = mode
+        self.scale = scale
+        self.flags = _FLAGS[(mode, scale)]
+        self.direct_rgb = mode == "rgb" and scale == 1 and _IMREAD_COLOR_RGB is not None
+        if self.direct_rgb:
+            self.flags = _IMREAD_COLOR_RGB
+        self.buffer = None
+
+    def decode(self, data):
+        # np.frombuffer 只是包装原始字节，不复制
+        with STAGE_SECONDS.time(stage="decode"):
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), self.flags)
+        if image is None:
+            raise ValueError("invalid image data")
+        if self.mode == "gray" or self.direct_rgb:
+            return image
+        if self.buffer is None or self.buffer.shape != image.shape:
+            self.buffer = np.empty_like(image)
+        with STAGE_SECONDS.time(stage="convert"):
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self.buffer)
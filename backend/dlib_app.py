@@ -1,187 +1,295 @@
-from flask import Flask, request
+import time
+# 模块导入耗时从这里开始计，由 / 报告
+_import_started = time.perf_counter()
+from flask import Flask, Response, request
 from flask_cors import CORS
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room
 import dlib
 import cv2
 import numpy as np
-from PIL import Image
-from io import BytesIO
-from math import sqrt
 import eventlet
+from eventlet import tpool
+from sessions import SessionRegistry
+from ingest import unpack_frame
+from results import FrameResult, publish, EVENT_MODES, LandmarkEncoder, landmark_encoder
+from decoder import FrameDecoder
+from calibration import StreamingCalibration
+import profiles
+import pubsub
+import blinks
+import geometry
+import config
+import metrics
+from metrics import STAGE_SECONDS, EMITS, ERRORS
+from models import STARTUP, LazyModel
 
 eventlet.monkey_patch()
 
 app = Flask(__name__)
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet")
+# 多进程部署时 emit 经 MESSAGE_QUEUE 转发，送达连接在其他进程上的客户端
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode="eventlet",
+                    **pubsub.server_options(config.MESSAGE_QUEUE))
 
-# 初始化 dlib 检测器
-detector = dlib.get_frontal_face_detector()
-predictor = dlib.shape_predictor("shape_predictor_68_face_landmarks.dat")
+# dlib 检测器和约 100 MB 的关键点模型在预热或第一帧时才加载，导入本模块不加载
+detector = LazyModel("face_detector", dlib.get_frontal_face_detector)
+predictor = LazyModel("predictor", lambda: dlib.shape_predictor("shape_predictor_68_face_landmarks.dat"))
 
-# 索引定义
-LEFT_EYE_INDICES = list(range(36, 42))
-RIGHT_EYE_INDICES = list(range(42, 48))
-MOUTH_OUTER_INDICES = list(range(48, 60))
-MOUTH_INNER_INDICES = list(range(60, 68))
+def load_models():
+    detector.get()
+    predictor.get()
+
+def warm_up(shape=(480, 640)):
+    # 加载两个模型并在空白帧上各跑一次
+    load_models()
+    gray = np.zeros(shape, dtype=np.uint8)
+    start = time.perf_counter()
+    detector.get()(gray)
+    predictor.get()(gray, dlib.rectangle(0, 0, shape[1] // 2, shape[0] // 2))
+    return {"first_inference": time.perf_counter() - start}
+
+class FaceTracker:
+    # HOG 检测是 dlib 路径里最贵的一步：只在每 interval 帧或跟踪置信度下降时才检测，
+    # 其余帧沿用上一帧的人脸框（reuse）或用相关滤波跟踪器更新人脸框（correlation）
+    def __init__(self, interval=10, mode="correlation", min_psr=7.0, pyramid=0):
+        self.interval = interval
+        self.mode = mode
+        self.min_psr = min_psr
+        # 检测前先 pyrDown 的层数，每层边长减半（人脸太小时会漏检）
+        self.pyramid = pyramid
+        self.faces = []
+        self.trackers = []
+        self.since_detect = 0
+
+    def _detect(self, gray):
+        image = gray
+        for _ in range(self.pyramid):
+            image = cv2.pyrDown(image)
+        scale = 2 ** self.pyramid
+        return [dlib.rectangle(f.left() * scale, f.top() * scale, f.right() * scale, f.bottom() * scale)
+                for f in detector.get()(image)]
+
+    def _track(self, gray):
+        if self.mode == "reuse":
+            return self.faces
+        faces = []
+        for tracker in self.trackers:
+            if tracker.update(gray) < self.min_psr:
+                return None
+            p = tracker.get_position()
+            faces.append(dlib.rectangle(int(p.left()), int(p.top()), int(p.right()), int(p.bottom())))
+        return faces
+
+    def update(self, gray):
+        if self.faces and self.since_detect < self.interval:
+            faces = self._track(gray)
+            if faces:
+                self.since_detect += 1
+                self.faces = faces
+                return faces
+        self.since_detect = 0
+        self.faces = self._detect(gray)
+        self.trackers = []
+        if self.mode == "correlation":
+            for face in self.faces:
+                tracker = dlib.correlation_tracker()
+                tracker.start_track(gray, face)
+                self.trackers.append(tracker)
+        return self.faces
 
 class BlinkDetector:
-    def __init__(self):
-        self.blink_counter = 0
-        self.total_blinks = 0
-        self.current_eye_state = "open"
-        self.calibrating = True
-        self.ratios = []
-        self.min_ratio = float("inf")
-        self.max_ratio = float("-inf")
-        self.threshold = 0.25
-
-        self.left_blink_counter = 0
-        self.right_blink_counter = 0
-        self.left_total_blinks = 0
-        self.right_total_blinks = 0
-        self.left_eye_state = "open"
-        self.right_eye_state = "open"
-
-    def _blink_ratio(self, eye):
-        def euclidean(p1, p2):
-            return sqrt((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)
-        hor = euclidean(eye[0], eye[3])
-        ver1 = euclidean(eye[1], eye[5])
-        ver2 = euclidean(eye[2], eye[4])
-        ver = (ver1 + ver2) / 2.0
-        return ver / hor if hor != 0 else 0
+    def __init__(self, emit, event_mode="legacy", landmarks=None, profile=None):
+        # emit(event, data)：由会话绑定到对应房间
+        self.emit = emit
+        # frame_result：每帧一条合并消息；legacy：旧的逐事件消息；both：两者都发
+        self.event_mode = event_mode
+        # 关键点的编码格式与发送频率上限
+        self.landmarks = landmarks or LandmarkEncoder()
+        self.frames = 0
+        # 当前帧的客户端序号，写进 frame_result（见 ingest.unpack_frame）
+        self.seq = None
+        # dlib 只需要灰度图，JPEG 直接解码成灰度，不做颜色转换
+        self.decoder = FrameDecoder("gray", config.DECODE_SCALE)
+        self.tracker = FaceTracker(config.DLIB_DETECT_INTERVAL, config.DLIB_TRACKER,
+                                   config.DLIB_MIN_PSR, config.DLIB_DETECT_PYRAMID)
+        # 双眼 / 左眼 / 右眼的眨眼状态机
+        self.blinks = blinks.BlinkStates()
+        # EAR 阈值的流式校准，校准期间也照常检测
+        self.calibration = StreamingCalibration(config.EAR_BASELINE, config.CALIBRATION_FRAMES,
+                                                config.CALIBRATION_RATE)
+        # 客户端的校准档案：回来的玩家直接用上次的阈值检测
+        self.profile = profile
+        if profile is not None and profile.calibration:
+            self.calibration.restore(profile.calibration)
+
+    def start_calibration(self):
+        self.calibration.restart()
+
+    def save_profile(self):
+        if self.profile is not None and self.calibration.state() is not None:
+            self.profile.save(self.calibration.state())
+
+    def close(self):
+        self.save_profile()
 
     def process_landmarks(self, landmarks, frame_width, frame_height):
-        def normalize(p):
-            return (p[0] / frame_width, p[1] / frame_height, 0.0)
-
-        # 提取眼睛和嘴巴关键点（像素坐标）
-        left_eye = [landmarks[i] for i in LEFT_EYE_INDICES]
-        right_eye = [landmarks[i] for i in RIGHT_EYE_INDICES]
-        mouth_outer = [landmarks[i] for i in MOUTH_OUTER_INDICES]
-        mouth_inner = [landmarks[i] for i in MOUTH_INNER_INDICES]
-
-        # 转换为归一化坐标发送给前端
-        left_eye_norm = [normalize(p) for p in left_eye]
-        right_eye_norm = [normalize(p) for p in right_eye]
-        mouth_outer_norm = [normalize(p) for p in mouth_outer]
-        mouth_inner_norm = [normalize(p) for p in mouth_inner]
-
-        socketio.start_background_task(lambda: socketio.emit("eye_landmarks", {
-            "left_eye": left_eye_norm,
-            "right_eye": right_eye_norm,
-            "mouth_outer": mouth_outer_norm,
-            "mouth_inner": mouth_inner_norm
-        }))
+        with STAGE_SECONDS.time(stage="detect"):
+            result = self._detect(landmarks, frame_width, frame_height)
+        # 整帧结果一次性发送
+        with STAGE_SECONDS.time(stage="emit"):
+            publish(self.emit, result, self.event_mode)
+
+    def _detect(self, landmarks, frame_width, frame_height):
+        # landmarks: (68, 2) 像素坐标，取出眼睛和嘴巴子集
+        layout = geometry.DLIB
+        points = geometry.select(landmarks, layout)
+
+        # 转换为归一化坐标发送给前端（z 补 0）
+        normalized = np.zeros((layout.size, 3), dtype=np.float32)
+        normalized[:, :2] = points / (frame_width, frame_height)
+
+        self.frames += 1
+        result = FrameResult(self.frames, self.seq)
+        if self.landmarks.due():
+            result.landmarks = self.landmarks.encode(normalized, layout)
 
         # 眨眼检测（像素坐标）
-        left_ratio = self._blink_ratio(left_eye)
-        right_ratio = self._blink_ratio(right_eye)
-        avg_ratio = (left_ratio + right_ratio) / 2.0
-
-        if self.calibrating:
-            self.min_ratio = min(self.min_ratio, avg_ratio)
-            self.max_ratio = max(self.max_ratio, avg_ratio)
-            self.ratios.append(avg_ratio)
-            if len(self.ratios) >= 100:
-                self.threshold = self.min_ratio + (self.max_ratio - self.min_ratio) * 0.4
-                self.calibrating = False
-                socketio.start_background_task(lambda: socketio.emit("calibrated", {
-                    "threshold": self.threshold
-                }))
-            return
-
-        # 双眼眨眼状态检测
-        if avg_ratio < self.threshold:
-            if self.current_eye_state != "closed":
-                self.current_eye_state = "closed"
-                socketio.start_background_task(lambda: socketio.emit("eye_state", {"status": "closed"}))
-            self.blink_counter += 1
-        else:
-            if self.blink_counter > 2:
-                self.total_blinks += 1
-                socketio.start_background_task(lambda: socketio.emit("blink_event", {
-                    "total": self.total_blinks
-                }))
-            self.blink_counter = 0
-            if self.current_eye_state != "open":
-                self.current_eye_state = "open"
-                socketio.start_background_task(lambda: socketio.emit("eye_state", {"status": "open"}))
-
-        # 左右眼分别检测
-        if left_ratio < self.threshold:
-            self.left_blink_counter += 1
-            if self.left_eye_state != "closed":
-                self.left_eye_state = "closed"
-                socketio.start_background_task(lambda: socketio.emit("left_eye_state", {"status": "closed"}))
-        else:
-            if self.left_blink_counter > 2:
-                self.left_total_blinks += 1
-                socketio.start_background_task(lambda: socketio.emit("left_blink_event", {
-                    "total": self.left_total_blinks
-                }))
-            self.left_blink_counter = 0
-            if self.left_eye_state != "open":
-                self.left_eye_state = "open"
-                socketio.start_background_task(lambda: socketio.emit("left_eye_state", {"status": "open"}))
-
-        if right_ratio < self.threshold:
-            self.right_blink_counter += 1
-            if self.right_eye_state != "closed":
-                self.right_eye_state = "closed"
-                socketio.start_background_task(lambda: socketio.emit("right_eye_state", {"status": "closed"}))
-        else:
-            if self.right_blink_counter > 2:
-                self.right_total_blinks += 1
-                socketio.start_background_task(lambda: socketio.emit("right_blink_event", {
-                    "total": self.right_total_blinks
-                }))
-            self.right_blink_counter = 0
-            if self.right_eye_state != "open":
-                self.right_eye_state = "open"
-                socketio.start_background_task(lambda: socketio.emit("right_eye_state", {"status": "open"}))
-
-detector_obj = BlinkDetector()
+        ratios = geometry.face_ratios(points, layout)
+        left_ratio, right_ratio, avg_ratio, mouth_ratio = ratios.tolist()
+        result.ratios = {"avg": avg_ratio, "left": left_ratio, "right": right_ratio,
+                         "mouth": mouth_ratio}
+
+        # 阈值每帧更新；每轮校准结束、从档案恢复后的第一帧各通知一次，校准期间也照常检测
+        calibration = self.calibration
+        if calibration.update(avg_ratio):
+            result.add("calibrated", {
+                "threshold": calibration.threshold
+            })
+            self.save_profile()
+        result.calibrating = calibration.calibrating
+
+        # 双眼与左右眼一次更新
+        for _, name, data in self.blinks.events(self.blinks.update(ratios[blinks.COLUMNS], calibration.threshold)):
+            result.add(name, data)
+
+        return result
+
+def create_detector(session):
+    event_mode = session.options.get("events")
+    if event_mode not in EVENT_MODES:
+        event_mode = config.EVENT_MODE
+
+    def emit(event, data):
+        EMITS.inc(event=event)
+        socketio.emit(event, data, to=session.channel)
+
+    return BlinkDetector(emit, event_mode, landmark_encoder(session.options),
+                         profiles.STORE.bind(session.options.get("profile"), "dlib"))
+
+# dlib 的人脸检测器和关键点模型没有跨帧状态，可以共享；眨眼状态与校准按会话隔离
+sessions = SessionRegistry(create_detector, mailbox_slots=config.MAILBOX_SLOTS)
+metrics.REGISTRY.gauge("active_sessions", "Connected Socket.IO sessions", callback=lambda: len(sessions))
 
 def shape_to_np(shape):
-    # 返回 (x, y) 像素坐标
-    return [(shape.part(i).x, shape.part(i).y) for i in range(68)]
+    # 一次性读成 (68, 2) 的像素坐标数组
+    return np.array([(p.x, p.y) for p in shape.parts()], dtype=np.float32)
+
+@socketio.on("connect")
+def handle_connect(auth=None):
+    # 前端同一页面的多个连接携带相同 channel，共享一个结果房间
+    auth = auth or {}
+    channel = auth.get("channel") or request.sid
+    join_room(channel)
+    sessions.open(request.sid, channel, auth)
+
+@socketio.on("disconnect")
+def handle_disconnect(*args):
+    sessions.close(request.sid)
+
+def process_image(blink_detector, image_data):
+    if not (detector.loaded and predictor.loaded):
+        # 预热还没完成：在 tpool 里加载（或等预热线程加载完），不在主循环里加载模型
+        tpool.execute(load_models)
+    gray = blink_detector.decoder.decode(image_data)
+
+    h, w = gray.shape[:2]
+    with STAGE_SECONDS.time(stage="face_detect"):
+        faces = blink_detector.tracker.update(gray)
+    for face in faces:
+        with STAGE_SECONDS.time(stage="landmarks"):
+            landmarks = shape_to_np(predictor.get()(gray, face))
+        blink_detector.process_landmarks(landmarks, w, h)
+
+def consume_frames(session):
+    # 每个会话一个消费协程：总是取信箱里最新的一帧
+    while True:
+        frame = session.mailbox.get()
+        if frame is None or session.closed:
+            break
+        image_data, seq = frame
+        try:
+            start = time.perf_counter()
+            session.detector.seq = seq
+            process_image(session.detector, image_data)
+            session.flow.observe(time.perf_counter() - start)
+        except Exception as e:
+            ERRORS.inc()
+            print("[ERROR] Frame processing failed:", e)
 
 @socketio.on("frame")
 def handle_frame(data):
-    try:
-        if hasattr(data, "read"):
-            image_data = data.read()
-        else:
-            image_data = data
-        img = Image.open(BytesIO(image_data))
-        frame = cv2.cvtColor(np.array(img), cv2.COLOR_RGB2BGR)
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        h, w = frame.shape[:2]
-        faces = detector(gray)
-        if not faces:
-            return
-
-        for face in faces:
-            shape = predictor(gray, face)
-            landmarks = shape_to_np(shape)
-            detector_obj.process_landmarks(landmarks, w, h)
-    except Exception as e:
-        print("[ERROR] Frame processing failed:", e)
+    session = sessions.get(request.sid)
+    if session is None:
+        # 已断开（或从未连接）的 sid
+        return
+    image_data, seq = unpack_frame(data)
+    if config.RECORD_DIR:
+        with STAGE_SECONDS.time(stage="record"):
+            session.record(image_data, config.RECORD_DIR)
+    session.mailbox.put((image_data, seq))
+    if session.consumer is None:
+        session.consumer = socketio.start_background_task(consume_frames, session)
+    if config.FLOW_CONTROL:
+        # 只发给发送帧的这条连接，而不是整个 channel
+        recommendation = session.flow.update()
+        if recommendation is not None:
+            socketio.emit("flow_control", recommendation, to=request.sid)
 
 @app.route("/start_calibration", methods=["POST"])
 def start_calibration():
-    detector_obj.calibrating = True
-    detector_obj.ratios.clear()
-    detector_obj.min_ratio = float("inf")
-    detector_obj.max_ratio = float("-inf")
+    # 只重新校准指定 channel（一个页面）的会话，不影响其他玩家
+    channel = request.args.get("channel") or (request.get_json(silent=True) or {}).get("channel")
+    if not channel:
+        return {"error": "channel is required"}, 400
+    sessions.start_calibration(channel)
     return {"status": "calibrating"}
 
+@app.route("/stats")
+def stats():
+    # 每个会话的收帧/处理/丢帧数与排队等待时间
+    return {"sessions": [session.stats() for session in sessions]}
+
+@app.route("/metrics")
+def metrics_route():
+    # Prometheus 文本格式：各阶段耗时直方图、帧计数、会话数与消息数
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
+@app.before_request
+def start_warm_up():
+    # 不经过 __main__ 启动时，第一个 HTTP 请求开始预热
+    STARTUP.start(socketio.start_background_task, lambda: tpool.execute(warm_up))
+
 @app.route("/")
 def index():
-    return {"status": "backend is live"}
+    # 预热完成前返回 503，健康检查据此判断能否接流量；同时报告各启动阶段耗时
+    report = STARTUP.report()
+    if not STARTUP.ready:
+        return dict(report, status="warming up"), 503
+    return dict(report, status="backend is live")
+
+STARTUP.record("import", time.perf_counter() - _import_started)
 
 if __name__ == "__main__":
-    socketio.run(app, host="0.0.0.0", port=5000, debug=True, use_reloader=False)
+    # 模型加载放在 tpool 的线程里，预热期间主循环照常响应 /
+    STARTUP.start(socketio.start_background_task, lambda: tpool.execute(warm_up))
+    socketio.run(app, host="0.0.0.0", port=config.PORT, debug=True, use_reloader=False)
@@ -0,0 +1,132 @@
+import numpy as np
+
+# EAR 历史与 EARM 滤波：定长环形缓冲区，每个样本 O(1) 更新，不随会话时长增长
+
+# center：在历史缓冲区中点求值（旧行为，缓冲区满后滞后约 history / 2 帧）
+# causal：在窗口已完整的最新样本处求值，滞后只有滤波器半宽 (window_size + 1) // 2 帧
+EARM_MODES = ("center", "causal")
+
+
+class RingBuffer:
+    # 预分配的环形缓冲区，满了之后覆盖最旧的样本
+    # 下标从最旧的样本开始计数，负下标从最新的样本开始
+    def __init__(self, capacity, dtype=np.float64):
+        self.data = np.zeros(capacity, dtype=dtype)
+        self.capacity = capacity
+        self.head = 0
+        self.count = 0
+
+    def append(self, value):
+        self.data[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("ring buffer index out of range")
+        return self.data[(self.head - self.count + index) % self.capacity].item()
+
+    def values(self):
+        # 按时间顺序排列的副本（最旧的在前）
+        start = (self.head - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            return self.data[start:start + self.count].copy()
+        return np.concatenate((self.data[start:], self.data[:self.head]))
+
+    def max(self):
+        if not self.count:
+            raise ValueError("max of empty ring buffer")
+        if self.count < self.capacity:
+            return self.values().max().item()
+        return self.data.max().item()
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+
+class EarmFilter:
+    # EARM(t) = h[t-o] + h[t-o+1] + h[t+o-1] + h[t+o] - 4 * h[t]，o = (window_size + 1) // 2
+    # 眨眼时 h[t] 明显低于两侧的样本，EARM 出现正峰值；睁眼平稳时接近 0
+    def __init__(self, window_size=11, history=100, mode="center"):
+        if mode not in EARM_MODES:
+            raise ValueError("unknown EARM mode: %s" % mode)
+        self.mode = mode
+        self.window_size = window_size
+        self.offset = (window_size + 1) // 2
+        if history < 2 * self.offset + 1:
+            raise ValueError("history too short for window size %d" % window_size)
+        self.history = RingBuffer(history)
+
+    def update(self, ear):
+        self.history.append(ear)
+
+    def ready(self):
+        return len(self.history) >= self.window_size
+
+    def value_at(self, t):
+        # 窗口超出已有样本时返回 0（与旧实现一致）
+        h = self.history
+        o = self.offset
+        if t - o < 0 or t + o >= len(h):
+            return 0
+        return h[t - o] + h[t - (o - 1)] + h[t + (o - 1)] + h[t + o] - 4 * h[t]
+
+    def center(self):
+        # 在历史缓冲区的中点求值
+        return self.value_at(len(self.history) // 2)
+
+    def latest(self):
+        # 在右侧窗口刚好完整的最新样本处求值
+        return self.value_at(len(self.history) - 1 - self.offset)
+
+    def value(self):
+        return self.latest() if self.mode == "causal" else self.center()
+
+    def clear(self):
+        self.history.clear()
+
+
+class EarmBlinkDetector:
+    # 由 EARM 驱动的眨眼状态机，earm_detect 与 app 的 method="earm" 共用
+    # 校准：收集 calibration_frames 个 EARM 值，阈值取最大值的 0.9
+    def __init__(self, window_size=11, history=100, mode="center", calibration_frames=30, threshold=-0.06):
+        self.filter = EarmFilter(window_size, history, mode)
+        self.samples = RingBuffer(calibration_frames)
+        self.threshold = threshold
+        self.calibrating = True
+        self.state = "open"
+        self.total_blinks = 0
+
+    def start_calibration(self):
+        self.calibrating = True
+        self.samples.clear()
+
+    def update(self, ear):
+        # 返回 (EARM 值, [(事件名, 数据), ...])；样本还不够一个窗口时 EARM 值为 None
+        self.filter.update(ear)
+        if not self.filter.ready():
+            return None, []
+        value = self.filter.value()
+        events = []
+        if self.calibrating:
+            self.samples.append(value)
+            if len(self.samples) >= self.samples.capacity:
+                self.threshold = self.samples.max() * 0.9
+                self.calibrating = False
+                events.append(("calibrated", {"threshold": self.threshold}))
+        elif value < self.threshold and self.state != "closed":
+            self.state = "closed"
+            events.append(("eye_state", {"status": "closed"}))
+        elif value >= self.threshold and self.state == "closed":
+            self.total_blinks += 1
+            self.state = "open"
+            events.append(("eye_state", {"status": "open"}))
+            events.append(("blink_event", {"total": self.total_blinks}))
+        return value, events
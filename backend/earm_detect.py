@@ -1,12 +1,23 @@
-from flask import Flask, Response, render_template
+from flask import Flask, Response, render_template, request
 import cv2
 import mediapipe as mp
-from math import sqrt
 from flask_cors import CORS
 from flask_socketio import SocketIO
 import eventlet
 import eventlet.green.threading as threading
+from eventlet import tpool
 import time
+import geometry
+from earm import EarmBlinkDetector
+from tracking import FaceTracks
+import numpy as np
+from broadcast import FrameBroadcaster
+from overlay import Overlay, OVERLAY_LEVELS
+from pipeline import FrameGrabber, LatestSlot, PIPELINE_FRAMES
+import config
+import metrics
+from metrics import STAGE_SECONDS, FRAMES_RECEIVED, FRAMES_PROCESSED, EMITS
+from models import STARTUP, LazyModel
 
 eventlet.monkey_patch()
 
@@ -14,156 +25,149 @@ app = Flask(__name__, static_folder="static", template_folder="templates")
 CORS(app)
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
 
-mp_drawing = mp.solutions.drawing_utils
 mp_face_mesh = mp.solutions.face_mesh
-face_mesh = mp_face_mesh.FaceMesh(
+# FaceMesh 在预热或第一帧时才创建
+face_mesh = LazyModel("model", lambda: mp_face_mesh.FaceMesh(
     static_image_mode=False,
     max_num_faces=2,
     min_detection_confidence=0.5,
     min_tracking_confidence=0.5
-)
+))
 
-LEFT_EYE = [33, 160, 158, 133, 153, 144]
-RIGHT_EYE = [362, 385, 387, 263, 373, 380]
+def warm_up(shape=(480, 640, 3)):
+    # 加载模型并在空白帧上跑一次计算图，开始推流时第一帧不再等模型初始化
+    model = face_mesh.get()
+    start = time.perf_counter()
+    model.process(np.zeros(shape, dtype=np.uint8))
+    return {"first_inference": time.perf_counter() - start}
+
+def emit(event, data):
+    # 在后台协程里发送，不阻塞采集循环；data 在调用时就已构造好
+    EMITS.inc(event=event)
+    socketio.start_background_task(socketio.emit, event, data)
 
 class VideoStreamer:
     def __init__(self):
-        self.frame = None
+        # 编码后的帧通过广播器分发给所有 /video_feed 观看者
+        self.broadcaster = FrameBroadcaster()
+        # 调试叠加层级别，可通过 /overlay 路由在运行时切换
+        self.overlay = Overlay(config.OVERLAY)
         self.stop_event = threading.Event()
-        self.lock = threading.Lock()
         self.blink_counter = 0
-        self.total_blinks = 0
-        self.cap = None
+        # 采集线程 -> 推理协程 -> 编码协程，之间只传最新一帧
+        self.grabber = FrameGrabber(0, stage="inference")
+        self.encode_slot = LatestSlot("encode")
         self.stream_greenlet = None
-        self.current_eye_state = "open"
-        self.ear_history = []
+        self.encode_greenlet = None
         self.ear_window_size = 11
-        self.calibrating = True
-        self.earm_samples = []
-        self.earm_threshold = -0.06
+        # 画面里的每张脸按质心匹配到稳定的玩家编号，各自独立的 EAR 历史、校准与眨眼计数
+        self.tracks = FaceTracks(max_players=2)
+        self.players = {}
         self.blink_cooldown = 0.5
         self.last_blink_time = 0
 
-    def _calc_earm(self, index):
-        X = self.ear_window_size
-        t = index
-        offset = (X + 1) // 2
-        if t - offset < 0 or t + offset >= len(self.ear_history):
-            return 0
-        return (
-            self.ear_history[t - offset] +
-            self.ear_history[t - (offset - 1)] +
-            self.ear_history[t + (offset - 1)] +
-            self.ear_history[t + offset] -
-            4 * self.ear_history[t]
-        )
-
     def start_stream(self):
+        # 返回是否在推流；上一次的采集线程还没退出时不启动
         if self.stream_greenlet and not self.stream_greenlet.dead:
-            return
+            return True
+        if not self.grabber.start():
+            return False
         self.stop_event.clear()
+        self.broadcaster.open()
+        self.encode_slot.open()
         self.stream_greenlet = eventlet.spawn(self._capture_frames)
+        self.encode_greenlet = eventlet.spawn(self._encode_frames)
+        return True
 
     def stop_stream(self):
         self.stop_event.set()
-        if self.stream_greenlet:
-            self.stream_greenlet.wait(timeout=2)
-        if self.cap and self.cap.isOpened():
-            self.cap.release()
-        self.frame = None
+        self.grabber.stop()
+        self.encode_slot.close()
+        for greenlet in (self.stream_greenlet, self.encode_greenlet):
+            if greenlet:
+                with eventlet.Timeout(2, False):
+                    greenlet.wait()
+        self.broadcaster.close()
 
     def _capture_frames(self):
-        self.cap = cv2.VideoCapture(0)
+        # 推理阶段：每次取采集线程最新的一帧，处理不过来的帧由采集线程直接覆盖
+        seen = 0
         while not self.stop_event.is_set():
-            success, frame = self.cap.read()
-            if not success:
-                break
-
-            frame = cv2.flip(frame, 1)
-            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = face_mesh.process(rgb_frame)
+            seq, frame = self.grabber.latest(seen)
+            if seq == seen:
+                if not self.grabber.running:
+                    break
+                continue
+            seen = seq
+            FRAMES_RECEIVED.inc()
+
+            with STAGE_SECONDS.time(stage="convert"):
+                frame = cv2.flip(frame, 1)
+                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            # 推理在 tpool 线程里执行，期间主循环照常处理消息和视频流
+            with STAGE_SECONDS.time(stage="face_mesh"):
+                # 第一帧早于预热完成时，模型也在 tpool 线程里加载
+                results = tpool.execute(lambda image: face_mesh.get().process(image), rgb_frame)
 
             if results.multi_face_landmarks:
-                for face_landmarks in results.multi_face_landmarks:
-                    mp_drawing.draw_landmarks(
-                        image=frame,
-                        landmark_list=face_landmarks,
-                        connections=mp_face_mesh.FACEMESH_TESSELATION,
-                        landmark_drawing_spec=mp_drawing.DrawingSpec(color=(0,255,0), thickness=1),
-                        connection_drawing_spec=mp_drawing.DrawingSpec(color=(0,0,255), thickness=1)
-                    )
-
-                    landmarks = [(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark]
-                    left_ratio = self._blink_ratio(landmarks, LEFT_EYE)
-                    right_ratio = self._blink_ratio(landmarks, RIGHT_EYE)
-                    avg_ratio = (left_ratio + right_ratio) / 2
-
-                    self.ear_history.append(avg_ratio)
-                    if len(self.ear_history) > 100:
-                        self.ear_history.pop(0)
-
-                    if len(self.ear_history) >= self.ear_window_size:
-                        center_index = len(self.ear_history) // 2
-                        earm_val = self._calc_earm(center_index)
-
-                        socketio.start_background_task(
-                            lambda: socketio.emit("earm_value", {"value": earm_val})
-                        )
-                        socketio.start_background_task(
-                            lambda: socketio.emit("ear_value", {"value": avg_ratio})
-                        )
-
-                        if self.calibrating:
-                            self.earm_samples.append(earm_val)
-                            if len(self.earm_samples) >= 30:
-                                self.earm_threshold = max(self.earm_samples) * 0.9
-                                self.calibrating = False
-                                socketio.start_background_task(
-                                    lambda: socketio.emit("calibrated", {"threshold": self.earm_threshold})
-                                )
-                        else:
-                            if earm_val < self.earm_threshold and self.current_eye_state != "closed":
-                                self.current_eye_state = "closed"
-                                socketio.start_background_task(
-                                    lambda: socketio.emit("eye_state", {"status": "closed"})
-                                )
-                            elif earm_val >= self.earm_threshold and self.current_eye_state == "closed":
-                                self.total_blinks += 1
-                                self.current_eye_state = "open"
-                                socketio.start_background_task(
-                                    lambda: socketio.emit("eye_state", {"status": "open"})
-                                )
-                                socketio.start_background_task(
-                                    lambda: socketio.emit("blink_event", {"total": self.total_blinks})
-                                )
-
-            with self.lock:
-                _, buffer = cv2.imencode('.jpg', frame)
-                self.frame = buffer.tobytes()
-
-            eventlet.sleep(0.02)
-
-    def _blink_ratio(self, landmarks, eye_points):
-        def euclidean_distance(p1, p2):
-            x1, y1, z1 = p1
-            x2, y2, z2 = p2
-            return sqrt((x2 - x1)**2 + (y2 - y1)**2 + (z2 - z1)**2)
-
-        hor_distance = euclidean_distance(landmarks[eye_points[0]], landmarks[eye_points[3]])
-        ver_distance1 = euclidean_distance(landmarks[eye_points[1]], landmarks[eye_points[5]])
-        ver_distance2 = euclidean_distance(landmarks[eye_points[2]], landmarks[eye_points[4]])
-        ver_distance = (ver_distance1 + ver_distance2) / 2.0
-        return ver_distance / hor_distance if hor_distance != 0 else 0
+                # 叠加层只给 /video_feed 的观看者看，没人看时不画
+                draw = self.overlay.enabled and self.broadcaster.has_viewers
+                faces = np.stack([geometry.from_proto(face) for face in results.multi_face_landmarks])
+                players = self.tracks.assign(faces)
+                for face_landmarks, points, player in zip(results.multi_face_landmarks, faces, players):
+                    if player is not None:
+                        with STAGE_SECONDS.time(stage="detect"):
+                            self._detect(points, player)
+
+                    if draw:
+                        with STAGE_SECONDS.time(stage="draw"):
+                            self.overlay.draw(frame, face_landmarks, points)
+
+            # 没有观看者时不交给编码阶段
+            if self.broadcaster.has_viewers:
+                self.encode_slot.put(frame)
+            FRAMES_PROCESSED.inc()
+            PIPELINE_FRAMES.inc(stage="inference")
+
+    def _encode_frames(self):
+        # 编码阶段：只编码最新一帧，慢于推理时跳过中间的帧
+        while not self.stop_event.is_set():
+            frame = self.encode_slot.get()
+            if frame is None:
+                break
+            with STAGE_SECONDS.time(stage="encode"):
+                _, buffer = tpool.execute(cv2.imencode, '.jpg', frame)
+            self.broadcaster.publish(buffer.tobytes())
+            PIPELINE_FRAMES.inc(stage="encode")
+
+    def player(self, player):
+        state = self.players.get(player)
+        if state is None:
+            # EAR 历史保存在定长环形缓冲区里，EARM 每帧 O(1) 求值；EARM_MODE=causal 时滞后最小
+            state = self.players[player] = EarmBlinkDetector(self.ear_window_size, history=100,
+                                                             mode=config.EARM_MODE)
+        return state
+
+    def start_calibration(self):
+        for state in self.players.values():
+            state.start_calibration()
+
+    def _detect(self, points, player):
+        left_ratio, right_ratio, avg_ratio, _ = geometry.face_ratios(points).tolist()
+
+        earm_val, events = self.player(player).update(avg_ratio)
+
+        if earm_val is not None:
+            emit("earm_value", {"value": earm_val, "player": player})
+            emit("ear_value", {"value": avg_ratio, "player": player})
+            for name, data in events:
+                data["player"] = player
+                emit(name, data)
 
     def generate(self):
-        while not self.stop_event.is_set():
-            with self.lock:
-                if self.frame is None:
-                    eventlet.sleep(0.1)
-                    continue
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + self.frame + b'\r\n')
-            eventlet.sleep(0.025)
+        if self.stop_event.is_set():
+            return iter(())
+        return self.broadcaster.stream()
 
 video_streamer = VideoStreamer()
 
@@ -174,7 +178,8 @@ def video_feed():
 
 @app.route("/start_stream", methods=["POST"])
 def start_stream():
-    video_streamer.start_stream()
+    if not video_streamer.start_stream():
+        return {"error": "previous capture is still stopping"}, 503
     return {"status": "started"}
 
 @app.route("/stop_stream", methods=["POST"])
@@ -184,15 +189,30 @@ def stop_stream():
 
 @app.route("/start_calibration", methods=["POST"])
 def start_calibration():
-    video_streamer.calibrating = True
-    video_streamer.earm_samples.clear()
+    video_streamer.start_calibration()
     return {"status": "calibrating"}
 
+@app.route("/overlay", methods=["GET", "POST"])
+def overlay():
+    # POST {"level": "none" | "contours" | "full"} 切换调试叠加层
+    if request.method == "POST":
+        level = request.args.get("level") or (request.get_json(silent=True) or {}).get("level")
+        if level not in OVERLAY_LEVELS:
+            return {"error": "level must be one of %s" % ", ".join(OVERLAY_LEVELS)}, 400
+        video_streamer.overlay.set_level(level)
+    return {"level": video_streamer.overlay.level}
+
+@app.route("/metrics")
+def metrics_route():
+    return Response(metrics.REGISTRY.render(), mimetype=metrics.CONTENT_TYPE)
+
 @app.route("/")
 def index():
     return render_template("index.html")
 
 if __name__ == "__main__":
+    # 预热放在 tpool 的线程里，不阻塞主循环；进度见 /metrics 的 ready 与 startup_seconds
+    socketio.start_background_task(STARTUP.warm_up, lambda: tpool.execute(warm_up))
     socketio.run(app,
                 host="0.0.0.0",
                 port=5000,
@@ -0,0 +1,64 @@
+import time
+
+import config
+
+# 服务端驱动的发送速率控制：根据每个会话的处理耗时与信箱丢帧率，给前端推荐帧率、分辨率和 JPEG 质量
+# 丢帧多时乘性降低帧率，降到下限后再降分辨率 / 质量；空闲时逐步恢复到满帧率和原始画质
+
+# (最大边长, JPEG 质量)，0 表示保持摄像头原始尺寸；最后一级即旧版前端的固定设置
+LEVELS = [(320, 0.4), (480, 0.5), (640, 0.6), (0, 0.6)]
+
+
+class FlowController:
+    def __init__(self, mailbox, max_fps=None, min_fps=None, interval=None):
+        self.mailbox = mailbox
+        self.max_fps = max_fps or config.FLOW_MAX_FPS
+        self.min_fps = min_fps or config.FLOW_MIN_FPS
+        self.interval = interval or config.FLOW_INTERVAL
+        self.fps = float(self.max_fps)
+        self.level = len(LEVELS) - 1
+        # 单帧处理耗时（解码 + 推理 + 检测）的指数滑动平均
+        self.service = 0.0
+        self.last_check = time.monotonic()
+        self.last_counts = (0, 0)
+        self.sent = None
+
+    def observe(self, elapsed):
+        self.service = elapsed if not self.service else self.service * 0.8 + elapsed * 0.2
+
+    def recommendation(self):
+        max_dimension, quality = LEVELS[self.level]
+        return {"fps": round(self.fps), "max_dimension": max_dimension, "quality": quality}
+
+    def update(self, now=None):
+        # 每个 interval 最多调整一次；推荐值有变化时返回新的推荐，否则返回 None
+        now = time.monotonic() if now is None else now
+        if now - self.last_check < self.interval:
+            return None
+        self.last_check = now
+        received, dropped = self.mailbox.received, self.mailbox.dropped
+        new_received = received - self.last_counts[0]
+        new_dropped = dropped - self.last_counts[1]
+        self.last_counts = (received, dropped)
+        if not new_received or not self.service:
+            return None
+
+        pressure = new_dropped / new_received
+        # 留 20% 余量的单会话处理能力
+        capacity = 0.8 / self.service
+        if pressure > 0.1:
+            self.fps = max(self.min_fps, min(self.fps * 0.75, capacity))
+            if self.fps <= self.min_fps and capacity < self.min_fps and self.level > 0:
+                self.level -= 1
+        elif pressure == 0:
+            # 不丢帧时逐步回升，但不超过估计的处理能力
+            if self.fps < min(self.max_fps, capacity):
+                self.fps = min(self.max_fps, capacity, self.fps * 1.25 + 1)
+            elif self.level < len(LEVELS) - 1 and self.service * self.max_fps < 0.5:
+                self.level += 1
+
+        recommendation = self.recommendation()
+        if recommendation == self.sent:
+            return None
+        self.sent = recommendation
+        return recommendation
@@ -0,0 +1,108 @@
+import argparse
+import struct
+import time
+
+import cv2
+
+# 帧录制文件：文件头 MAGIC 之后依次是 [时间戳 float64][长度 uint32][JPEG 字节]
+# 时间戳为相对第一帧的秒数，回放时可以按原节奏推送
+MAGIC = b"EBGFRM1\n"
+_RECORD = struct.Struct("<dI")
+
+
+class FrameRecorder:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "wb")
+        self.file.write(MAGIC)
+        self.start = None
+        self.count = 0
+
+    def write(self, data, timestamp=None):
+        now = time.monotonic() if timestamp is None else timestamp
+        if self.start is None:
+            self.start = now
+        self.file.write(_RECORD.pack(now - self.start, len(data)))
+        self.file.write(data)
+        self.count += 1
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_frames(path, offset=None):
+    # 逐帧读出 (时间戳, JPEG 字节)；offset 为 frame_offsets 给出的某一帧的位置，从该帧开始读
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("not a frame recording: %s" % path)
+        if offset is not None:
+            f.seek(offset)
+        while True:
+            header = f.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return
+            timestamp, length = _RECORD.unpack(header)
+            yield timestamp, f.read(length)
+
+
+def frame_offsets(path):
+    # 每一帧记录在文件里的字节偏移；只读记录头，JPEG 字节直接 seek 跳过
+    offsets = []
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("not a frame recording: %s" % path)
+        while True:
+            offset = f.tell()
+            header = f.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return offsets
+            _, length = _RECORD.unpack(header)
+            f.seek(length, 1)
+            offsets.append(offset)
+
+
+def frames_from_video(path, quality=60, max_side=0):
+    # 把视频文件转成与浏览器发送的一致的 JPEG 帧序列（默认质量同前端的 0.6）
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    index = 0
+    try:
+        while True:
+            success, frame = cap.read()
+            if not success:
+                return
+            if max_side and max(frame.shape[:2]) > max_side:
+                scale = max_side / max(frame.shape[:2])
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            _, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            yield index / fps, buffer.tobytes()
+            index += 1
+    finally:
+        cap.release()
+
+
+def open_frames(path, **kwargs):
+    # 录制文件或任意 OpenCV 能读的视频
+    with open(path, "rb") as f:
+        is_recording = f.read(len(MAGIC)) == MAGIC
+    return read_frames(path) if is_recording else frames_from_video(path, **kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a video file into a frame recording")
+    parser.add_argument("video")
+    parser.add_argument("output")
+    parser.add_argument("--quality", type=int, default=60)
+    parser.add_argument("--max-side", type=int, default=0)
+    args = parser.parse_args()
+
+    recorder = FrameRecorder(args.output)
+    for timestamp, data in frames_from_video(args.video, args.quality, args.max_side):
+        recorder.write(data, timestamp)
+    recorder.close()
+    print("wrote %d frames to %s" % (recorder.count, args.output))
+
+
+if __name__ == "__main__":
+    main()
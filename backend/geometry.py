@@ -0,0 +1,103 @@
+import numpy as np
+
+# 眼部 / 嘴部几何计算，MediaPipe 与 dlib 两套关键点共用
+# 只取用到的关键点放进一个 float32 数组（子集），按 左眼 / 右眼 / 外唇 / 内唇 顺序排列
+# 所有函数都支持任意前导维度：(K, D)、(人脸数, K, D)、(帧数, 人脸数, K, D) ...
+
+# MediaPipe FaceMesh 关键点索引（见 mesh_map.jpg）
+LEFT_EYE = [33, 160, 158, 133, 153, 144]
+RIGHT_EYE = [362, 385, 387, 263, 373, 380]
+MOUTH_OUTER = [61, 185, 40, 39, 37, 0, 267, 269, 270, 409, 291,
+               375, 321, 405, 314, 17, 84, 181, 91, 146]
+MOUTH_INNER = [78, 95, 88, 178, 87, 14, 317, 402, 318, 324,
+               308, 415, 310, 311, 312, 13, 82, 81, 80, 191]
+
+# 脸部外轮廓，用来估计人脸框
+FACE_OVAL = [10, 338, 297, 332, 284, 251, 389, 356, 454, 323, 361, 288, 397, 365, 379, 378,
+             400, 377, 152, 148, 176, 149, 150, 136, 172, 58, 132, 93, 234, 127, 162, 21,
+             54, 103, 67, 109]
+
+# ratios 数组的列
+LEFT, RIGHT, AVG, MOUTH = range(4)
+
+
+class Layout:
+    # eye 的 6 个点顺序：外眼角、上 1、上 2、内眼角、下 2、下 1（与 dlib 的 36~41 一致）
+    # mouth_lips / mouth_corners：计算张嘴比例用的内唇上下中点和左右嘴角（原始索引）
+    def __init__(self, left_eye, right_eye, mouth_outer, mouth_inner, mouth_lips, mouth_corners):
+        self.indices = np.array(left_eye + right_eye + mouth_outer + mouth_inner, dtype=np.intp)
+        n = 0
+        self.left_eye = slice(n, n + len(left_eye))
+        n += len(left_eye)
+        self.right_eye = slice(n, n + len(right_eye))
+        n += len(right_eye)
+        self.mouth_outer = slice(n, n + len(mouth_outer))
+        n += len(mouth_outer)
+        self.mouth_inner = slice(n, n + len(mouth_inner))
+        self.size = n + len(mouth_inner)
+        position = {index: i for i, index in enumerate(self.indices.tolist())}
+        self.mouth_lips = [position[i] for i in mouth_lips]
+        self.mouth_corners = [position[i] for i in mouth_corners]
+
+
+MEDIAPIPE = Layout(LEFT_EYE, RIGHT_EYE, MOUTH_OUTER, MOUTH_INNER,
+                   mouth_lips=(13, 14), mouth_corners=(78, 308))
+DLIB = Layout(list(range(36, 42)), list(range(42, 48)), list(range(48, 60)), list(range(60, 68)),
+              mouth_lips=(62, 66), mouth_corners=(60, 64))
+
+
+def select(landmarks, layout=MEDIAPIPE):
+    # 从完整关键点数组 (..., N, D) 中取出子集 (..., K, D)
+    return np.asarray(landmarks, dtype=np.float32)[..., layout.indices, :]
+
+
+def from_proto(face_landmarks, layout=MEDIAPIPE):
+    # 直接从 MediaPipe 的 protobuf 里只读取子集，不构造 468 个点的列表
+    points = face_landmarks.landmark
+    return np.array([(points[i].x, points[i].y, points[i].z) for i in layout.indices],
+                    dtype=np.float32)
+
+
+def bbox_from_proto(face_landmarks):
+    # 归一化坐标下的人脸框 (left, top, right, bottom)
+    points = face_landmarks.landmark
+    xs = [points[i].x for i in FACE_OVAL]
+    ys = [points[i].y for i in FACE_OVAL]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def _distance(a, b):
+    return np.sqrt(np.sum((a - b) ** 2, axis=-1))
+
+
+def _safe_ratio(numerator, denominator):
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator),
+                     where=denominator != 0)
+
+
+def eye_aspect_ratio(eye):
+    # eye: (..., 6, D) -> (...)
+    hor = _distance(eye[..., 0, :], eye[..., 3, :])
+    ver = (_distance(eye[..., 1, :], eye[..., 5, :]) +
+           _distance(eye[..., 2, :], eye[..., 4, :])) / 2.0
+    return _safe_ratio(ver, hor)
+
+
+def mouth_ratio(points, layout=MEDIAPIPE):
+    lips = points[..., layout.mouth_lips, :]
+    corners = points[..., layout.mouth_corners, :]
+    return _safe_ratio(_distance(lips[..., 0, :], lips[..., 1, :]),
+                       _distance(corners[..., 0, :], corners[..., 1, :]))
+
+
+def face_ratios(points, layout=MEDIAPIPE):
+    # points: 子集 (..., K, D) -> (..., 4)，列依次为 LEFT / RIGHT / AVG / MOUTH
+    points = np.asarray(points, dtype=np.float32)
+    eyes = np.stack([points[..., layout.left_eye, :], points[..., layout.right_eye, :]], axis=-3)
+    ears = eye_aspect_ratio(eyes)
+    ratios = np.empty(points.shape[:-2] + (4,), dtype=np.float32)
+    ratios[..., LEFT] = ears[..., 0]
+    ratios[..., RIGHT] = ears[..., 1]
+    ratios[..., AVG] = ears.mean(axis=-1)
+    ratios[..., MOUTH] = mouth_ratio(points, layout)
+    return ratios
@@ -0,0 +1,359 @@
+import atexit
+import itertools
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import eventlet
+from eventlet.event import Event
+from eventlet.hubs import trampoline
+from eventlet.queue import LightQueue
+import cv2
+import numpy as np
+
+import geometry
+from metrics import STAGE_SECONDS
+
+# 单帧最大尺寸（1080p RGB），共享内存槽按此分配
+MAX_FRAME_BYTES = 1920 * 1080 * 3
+
+
+class FaceMeshRunner:
+    # 真正执行 FaceMesh 推理的对象：工作进程里各持有一个，也可以在当前进程直接使用
+    # 每个会话一个跟踪器（static_image_mode=False 依赖前一帧的跟踪结果）
+    # crop_side > 0 时启用裁剪模式：记住上一帧的人脸框，只在框附近的裁剪区域上推理，
+    # 裁剪图缩放到长边 crop_side，结果再映射回整帧坐标；跟丢时退回整帧
+    def __init__(self, max_num_faces=1, min_detection_confidence=0.5, min_tracking_confidence=0.5,
+                 crop_side=0, crop_pad=0.4):
+        self.options = dict(static_image_mode=False, max_num_faces=max_num_faces,
+                            min_detection_confidence=min_detection_confidence,
+                            min_tracking_confidence=min_tracking_confidence)
+        self.crop_side = crop_side
+        self.crop_pad = crop_pad
+        self.trackers = {}
+        self.windows = {}
+        # 按会话覆盖的最大人脸数（本地多人模式）
+        self.max_faces = {}
+        # 预热时创建好的跟踪器，由下一个使用默认选项的会话接手
+        self.spare = None
+
+    def _tracker(self, key, mode="full"):
+        # 整帧与裁剪图各用一个跟踪器，切换时不会拿错坐标系下的跟踪结果
+        tracker = self.trackers.get((key, mode))
+        if tracker is None:
+            options = dict(self.options)
+            if key in self.max_faces:
+                options["max_num_faces"] = self.max_faces[key]
+            if self.spare is not None and options == self.options:
+                tracker, self.spare = self.spare, None
+            else:
+                import mediapipe as mp
+                tracker = mp.solutions.face_mesh.FaceMesh(**options)
+            self.trackers[(key, mode)] = tracker
+        return tracker
+
+    def warm_up(self, shape=(480, 640, 3)):
+        # 导入 mediapipe、加载模型、在空白帧上跑一次计算图，返回各步耗时；
+        # 跑过空白帧的跟踪器没有跟踪状态，留给第一个会话直接使用
+        start = time.perf_counter()
+        import mediapipe as mp
+        loaded = time.perf_counter()
+        tracker = mp.solutions.face_mesh.FaceMesh(**self.options)
+        created = time.perf_counter()
+        tracker.process(np.zeros(shape, dtype=np.uint8))
+        if self.spare is not None:
+            self.spare.close()
+        self.spare = tracker
+        return {"mediapipe_import": loaded - start, "model_load": created - loaded,
+                "first_inference": time.perf_counter() - created}
+
+    def process(self, key, rgb, max_faces=None):
+        # 返回 (人脸数, K, 3) 的归一化坐标，只含 geometry.MEDIAPIPE 子集；没有检测到人脸时返回 None
+        # max_faces 只在该会话第一次推理、创建跟踪器时生效
+        if max_faces and key not in self.max_faces:
+            self.max_faces[key] = max_faces
+        if self.crop_side:
+            window = self.windows.get(key)
+            if window is not None:
+                faces = self._process_crop(key, rgb, window)
+                if faces is not None:
+                    return faces
+                # 跟丢了，本帧直接退回整帧
+                del self.windows[key]
+        results = self._tracker(key).process(rgb)
+        if not results.multi_face_landmarks:
+            return None
+        if self.crop_side:
+            self._update_window(key, rgb.shape, results.multi_face_landmarks, (0, 0, 1, 1))
+        return np.stack([geometry.from_proto(face) for face in results.multi_face_landmarks])
+
+    def _process_crop(self, key, rgb, window):
+        h, w = rgb.shape[:2]
+        x0, y0, x1, y1 = window
+        crop = rgb[y0:y1, x0:x1]
+        scale = self.crop_side / max(x1 - x0, y1 - y0)
+        if scale < 1:
+            crop = cv2.resize(crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_LINEAR)
+        else:
+            crop = np.ascontiguousarray(crop)
+        results = self._tracker(key, "crop").process(crop)
+        if not results.multi_face_landmarks:
+            return None
+        # 裁剪图归一化坐标 -> 整帧归一化坐标（z 与 x 同尺度）
+        sx, sy = (x1 - x0) / w, (y1 - y0) / h
+        bounds = (x0 / w, y0 / h, sx, sy)
+        self._update_window(key, rgb.shape, results.multi_face_landmarks, bounds)
+        faces = np.stack([geometry.from_proto(face) for face in results.multi_face_landmarks])
+        faces[..., 0] = faces[..., 0] * sx + bounds[0]
+        faces[..., 1] = faces[..., 1] * sy + bounds[1]
+        faces[..., 2] *= sx
+        return faces
+
+    def _update_window(self, key, shape, faces, bounds):
+        h, w = shape[:2]
+        ox, oy, sx, sy = bounds
+        boxes = np.array([geometry.bbox_from_proto(face) for face in faces])
+        left = (boxes[:, 0].min() * sx + ox) * w
+        top = (boxes[:, 1].min() * sy + oy) * h
+        right = (boxes[:, 2].max() * sx + ox) * w
+        bottom = (boxes[:, 3].max() * sy + oy) * h
+        side = max(right - left, bottom - top)
+        window = self.windows.get(key)
+        if window is not None:
+            # 人脸仍在当前裁剪框内部且大小相近时保持裁剪框不动，跟踪器看到的画面更稳定
+            x0, y0, x1, y1 = window
+            margin = side * self.crop_pad / 2
+            inside = (left - x0 >= margin and top - y0 >= margin and
+                      x1 - right >= margin and y1 - bottom >= margin)
+            if inside and side * (1 + 2 * self.crop_pad) * 1.5 > max(x1 - x0, y1 - y0):
+                return
+        half = side * (1 + 2 * self.crop_pad) / 2
+        cx, cy = (left + right) / 2, (top + bottom) / 2
+        self.windows[key] = (max(0, int(cx - half)), max(0, int(cy - half)),
+                             min(w, int(cx + half)), min(h, int(cy + half)))
+
+    def release(self, key):
+        self.windows.pop(key, None)
+        self.max_faces.pop(key, None)
+        for mode in ("full", "crop"):
+            tracker = self.trackers.pop((key, mode), None)
+            if tracker is not None:
+                tracker.close()
+
+    def close(self):
+        for key, _ in list(self.trackers):
+            self.release(key)
+        if self.spare is not None:
+            self.spare.close()
+            self.spare = None
+
+
+def _worker_main(conn, shm_names, options):
+    # eventlet 补丁后创建的管道是非阻塞的，工作进程里改回阻塞读写
+    os.set_blocking(conn.fileno(), True)
+    slots = [shared_memory.SharedMemory(name=name) for name in shm_names]
+    runner = FaceMeshRunner(**options)
+    try:
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                break
+            op = message[0]
+            if op == "process":
+                _, req_id, key, slot, shape, max_faces = message
+                nbytes = int(np.prod(shape))
+                frame = np.ndarray(shape, dtype=np.uint8, buffer=slots[slot].buf[:nbytes])
+                # 推理耗时随结果一起返回，由主进程记入指标
+                start = time.perf_counter()
+                try:
+                    faces = runner.process(key, frame, max_faces)
+                    conn.send((req_id, faces, None, time.perf_counter() - start))
+                except Exception as e:
+                    conn.send((req_id, None, repr(e), time.perf_counter() - start))
+            elif op == "warmup":
+                try:
+                    conn.send((message[1], runner.warm_up(), None, None))
+                except Exception as e:
+                    conn.send((message[1], None, repr(e), None))
+            elif op == "release":
+                runner.release(message[1])
+            elif op == "stop":
+                break
+    finally:
+        runner.close()
+        for shm in slots:
+            shm.close()
+
+
+class InferenceWorker:
+    # 主进程里对一个工作进程的代理：共享内存槽的数量即该进程允许的在途帧数
+    def __init__(self, ctx, inflight, options):
+        self.slots = [shared_memory.SharedMemory(create=True, size=MAX_FRAME_BYTES)
+                      for _ in range(inflight)]
+        self.free_slots = LightQueue()
+        for i in range(inflight):
+            self.free_slots.put(i)
+        self.conn, child_conn = ctx.Pipe()
+        # 只有在 trampoline 确认可读后才 recv，管道本身保持阻塞，避免读到半条消息时报错
+        os.set_blocking(self.conn.fileno(), True)
+        self.proc = ctx.Process(target=_worker_main,
+                                args=(child_conn, [s.name for s in self.slots], options),
+                                daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.pending = {}
+        self.sessions = set()
+        self.alive = True
+        self.closing = False
+        self.req_ids = itertools.count()
+        self.reader = eventlet.spawn(self._read_results)
+
+    def _read_results(self):
+        try:
+            while True:
+                # 等管道可读时才 recv，不阻塞 eventlet 主循环
+                trampoline(self.conn.fileno(), read=True)
+                req_id, result, error, elapsed = self.conn.recv()
+                # 预热请求不计入推理耗时
+                if elapsed is not None:
+                    STAGE_SECONDS.observe(elapsed, stage="face_mesh")
+                event = self.pending.pop(req_id, None)
+                if event is not None:
+                    event.send((result, error))
+        except (EOFError, OSError) as e:
+            if not self.closing:
+                print("[ERROR] Inference worker exited:", repr(e))
+        finally:
+            self.alive = False
+            for event in self.pending.values():
+                event.send((None, "inference worker exited"))
+            self.pending.clear()
+
+    def process(self, key, frame, max_faces=None):
+        slot = self.free_slots.get()
+        try:
+            if not self.alive:
+                raise RuntimeError("inference worker exited")
+            if frame.nbytes > MAX_FRAME_BYTES:
+                raise ValueError("frame too large: %s" % (frame.shape,))
+            buf = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.slots[slot].buf[:frame.nbytes])
+            np.copyto(buf, frame)
+            req_id = next(self.req_ids)
+            event = Event()
+            self.pending[req_id] = event
+            self.conn.send(("process", req_id, key, slot, frame.shape, max_faces))
+            result, error = event.wait()
+        finally:
+            self.free_slots.put(slot)
+        if error:
+            raise RuntimeError(error)
+        return result
+
+    def warm_up(self):
+        # 在工作进程里预热，返回 FaceMeshRunner.warm_up 的耗时
+        if not self.alive:
+            raise RuntimeError("inference worker exited")
+        req_id = next(self.req_ids)
+        event = Event()
+        self.pending[req_id] = event
+        self.conn.send(("warmup", req_id))
+        result, error = event.wait()
+        if error:
+            raise RuntimeError(error)
+        return result
+
+    def release(self, key):
+        self.sessions.discard(key)
+        if self.alive:
+            self.conn.send(("release", key))
+
+    def close(self):
+        self.closing = True
+        if self.alive:
+            try:
+                self.conn.send(("stop",))
+            except OSError:
+                pass
+        self.proc.join(timeout=2)
+        if self.proc.is_alive():
+            self.proc.terminate()
+        self.conn.close()
+        for shm in self.slots:
+            shm.close()
+            shm.unlink()
+
+
+class InferencePool:
+    # workers=0 时在当前进程内直接推理（离线工具、调试用）
+    # 否则启动 workers 个工作进程，每个会话固定分配到一个进程，以保持跟踪器状态
+    def __init__(self, workers=1, inflight=2, **options):
+        self.worker_count = workers
+        self.inflight = inflight
+        self.options = options
+        self.workers = []
+        self.assignments = {}
+        self.runner = FaceMeshRunner(**options) if workers == 0 else None
+
+    def start(self):
+        # 延迟到第一次使用时才启动进程：spawn 出的子进程会重新导入主模块
+        if self.runner is not None or self.workers:
+            return
+        ctx = multiprocessing.get_context("spawn")
+        self.workers = [InferenceWorker(ctx, self.inflight, self.options)
+                        for _ in range(self.worker_count)]
+        atexit.register(self.close)
+
+    def _worker_for(self, key):
+        worker = self.assignments.get(key)
+        if worker is not None and worker.alive:
+            return worker
+        if worker is not None:
+            # 工作进程异常退出，替换后重新分配
+            index = self.workers.index(worker)
+            worker.close()
+            self.workers[index] = InferenceWorker(multiprocessing.get_context("spawn"),
+                                                  self.inflight, self.options)
+            for k, w in list(self.assignments.items()):
+                if w is worker:
+                    del self.assignments[k]
+        worker = min(self.workers, key=lambda w: len(w.sessions))
+        worker.sessions.add(key)
+        self.assignments[key] = worker
+        return worker
+
+    def process(self, key, frame, max_faces=None):
+        if self.runner is not None:
+            with STAGE_SECONDS.time(stage="face_mesh"):
+                return self.runner.process(key, frame, max_faces)
+        self.start()
+        return self._worker_for(key).process(key, frame, max_faces)
+
+    def warm_up(self):
+        # 启动工作进程并同时预热；各步耗时取最慢的进程，另记进程启动耗时
+        if self.runner is not None:
+            return self.runner.warm_up()
+        start = time.perf_counter()
+        self.start()
+        started = time.perf_counter() - start
+        timings = list(eventlet.GreenPool().imap(lambda worker: worker.warm_up(), self.workers))
+        report = {phase: max(t[phase] for t in timings) for phase in timings[0]} if timings else {}
+        report["worker_start"] = started
+        return report
+
+    def release(self, key):
+        if self.runner is not None:
+            self.runner.release(key)
+            return
+        worker = self.assignments.pop(key, None)
+        if worker is not None:
+            worker.release(key)
+
+    def close(self):
+        if self.runner is not None:
+            self.runner.close()
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+        self.assignments.clear()
@@ -0,0 +1,81 @@
+import time
+from collections import deque
+
+import eventlet.green.threading as threading
+
+from metrics import FRAMES_RECEIVED, FRAMES_DROPPED, FRAMES_PROCESSED, STAGE_SECONDS
+
+
+def unpack_frame(data):
+    # frame 事件的载荷：JPEG 字节（或类文件对象），或压测工具 loadgen.py 发的 {"seq": 序号, "image": JPEG}
+    # 返回 (JPEG 字节, 序号)；序号原样写回该帧的 frame_result，客户端据此算端到端延迟
+    seq = None
+    if isinstance(data, dict):
+        seq = data.get("seq")
+        data = data.get("image")
+    if hasattr(data, "read"):
+        data = data.read()
+    return data, seq
+
+
+class FrameMailbox:
+    # 每个会话的帧信箱：最多保留 capacity 帧，满了就丢弃最旧的一帧（新帧优先）
+    # 推理跟不上发送速率时，积压不会增长，眨眼事件的延迟保持有界
+    def __init__(self, capacity=1):
+        self.capacity = capacity
+        self.frames = deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_last = 0.0
+
+    def put(self, frame):
+        with self.cond:
+            if self.closed:
+                return
+            self.received += 1
+            FRAMES_RECEIVED.inc()
+            if len(self.frames) >= self.capacity:
+                self.frames.popleft()
+                self.dropped += 1
+                FRAMES_DROPPED.inc()
+            self.frames.append((frame, time.monotonic()))
+            self.cond.notify()
+
+    def get(self):
+        # 阻塞（协程内）直到有新帧；信箱关闭后返回 None
+        with self.cond:
+            while not self.frames and not self.closed:
+                self.cond.wait()
+            if self.closed:
+                return None
+            frame, queued_at = self.frames.popleft()
+            wait = time.monotonic() - queued_at
+            self.processed += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.wait_last = wait
+            FRAMES_PROCESSED.inc()
+            STAGE_SECONDS.observe(wait, stage="queue_wait")
+            return frame
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.frames.clear()
+            self.cond.notify_all()
+
+    def stats(self):
+        return {
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "pending": len(self.frames),
+            "queue_wait_avg_ms": self.wait_total / self.processed * 1000 if self.processed else 0.0,
+            "queue_wait_max_ms": self.wait_max * 1000,
+            "queue_wait_last_ms": self.wait_last * 1000,
+        }
@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.request
+
+import socketio
+
+from framelog import open_frames
+from replay import percentile
+
+# 多客户端压测：N 个 Socket.IO 客户端按固定帧率回放录制的帧，frame 事件带序号 {"seq", "image"}，
+# 服务端在 frame_result 里原样返回序号，据此统计帧到结果的延迟、眨眼到 blink_event 的延迟、服务端丢帧率和吞吐
+# 客户端数按 --clients 逐级增加，每级跑 --duration 秒，得到一个后端在延迟变差前能承载多少玩家
+# 用法：python loadgen.py session.ebgf [--url http://127.0.0.1:5000] [--clients 1,2,4,8] [--fps 15]
+#                         [--duration 20] [--transport websocket|polling] [--max-p95 200] [--output report.json]
+# 依赖：pip install -r requirements-loadgen.txt（Socket.IO 客户端的长轮询与 websocket 传输）
+# 压测进程本身也占 CPU，测容量时最好和后端放在不同机器上
+# serve.py 按客户端 IP 粘性分配，同一台机器发起的连接都落在同一个服务进程上，应直接压单个服务进程
+
+
+class LoadClient:
+    def __init__(self, url, frames, fps, channel, transports=None):
+        self.frames = frames
+        self.fps = fps
+        # seq -> 发送时刻
+        self.sent = {}
+        # (seq, 收到时刻, 双眼 EAR, 是否有 blink_event)，按收到顺序
+        self.results = []
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on("frame_result", self.on_result)
+        # 每个客户端单独一个 channel，结果不会发到别的客户端
+        self.sio.connect(url, auth={"channel": channel, "events": "frame_result"},
+                         transports=transports, wait_timeout=10)
+        self.sid = self.sio.get_sid()
+
+    def on_result(self, data):
+        received = time.perf_counter()
+        if data.get("seq") is None:
+            return
+        ratios = data.get("ratios")
+        blink = any(name == "blink_event" for name, _ in data["events"])
+        self.results.append((data["seq"], received, ratios["avg"] if ratios else None, blink))
+
+    def run(self, start, stop):
+        # 按固定帧率发送；发送跟不上时不补发，下一帧照常按时间表
+        seq = 0
+        while True:
+            due = start + seq / self.fps
+            if due >= stop or not self.sio.connected:
+                break
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            self.sent[seq] = time.perf_counter()
+            self.sio.emit("frame", {"seq": seq, "image": self.frames[seq % len(self.frames)]})
+            seq += 1
+
+    def latencies(self):
+        return [received - self.sent[seq] for seq, received, _, _ in self.results if seq in self.sent]
+
+    def blink_latencies(self, window=90):
+        # 与 replay.blink_latencies 相同的近似：blink_event 的收到时刻减去它之前 window 个结果内
+        # （不早于上一次眨眼）EAR 最低那一帧的发送时刻
+        latencies = []
+        previous = 0
+        for index, (_, received, _, blink) in enumerate(self.results):
+            if not blink:
+                continue
+            candidates = [(ear, seq) for seq, _, ear, _ in self.results[max(previous, index - window):index + 1]
+                          if ear is not None]
+            previous = index + 1
+            if candidates:
+                latencies.append(received - self.sent[min(candidates)[1]])
+        return latencies
+
+    def close(self):
+        self.sio.disconnect()
+
+
+def get_json(url):
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.load(response)
+
+
+def wait_ready(url, timeout=120):
+    # 后端预热完成前 / 返回 503
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return get_json(url + "/")
+        except (OSError, ValueError) as e:
+            if time.monotonic() > deadline:
+                raise RuntimeError("backend at %s not ready: %r" % (url, e))
+            time.sleep(1)
+
+
+def server_stats(url, sids):
+    # 只统计本次压测的会话（/stats 里的 sid 与客户端的 sid 相同）
+    totals = {"received": 0, "processed": 0, "dropped": 0}
+    for session in get_json(url + "/stats")["sessions"]:
+        if session["sid"] in sids:
+            for key in totals:
+                totals[key] += session[key]
+    totals["drop_rate"] = totals["dropped"] / totals["received"] if totals["received"] else 0.0
+    return totals
+
+
+def run_step(url, frames, clients, fps, duration, transports=None, settle=2.0):
+    tag = "loadgen-%d-%d" % (os.getpid(), clients)
+    loaders = [LoadClient(url, frames, fps, "%s-%d" % (tag, i), transports) for i in range(clients)]
+    # 各客户端的发送时刻错开，不让所有帧同时到达
+    start = time.perf_counter() + 1.0
+    stop = start + duration
+    threads = [threading.Thread(target=c.run, args=(start + i / (fps * clients), stop), daemon=True)
+               for i, c in enumerate(loaders)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # 等最后几帧的结果回来，断开前取服务端统计（断开后会话就没了）
+    time.sleep(settle)
+    server = server_stats(url, {c.sid for c in loaders})
+    for c in loaders:
+        c.close()
+
+    latencies = [value for c in loaders for value in c.latencies()]
+    blinks = [value for c in loaders for value in c.blink_latencies()]
+    sent = sum(len(c.sent) for c in loaders)
+    results = sum(len(c.results) for c in loaders)
+    return {
+        "clients": clients,
+        "fps": fps,
+        "duration_s": duration,
+        "sent": sent,
+        # 没有结果的帧：服务端丢弃、没有检测到人脸或结束时仍未返回
+        "results": results,
+        "throughput_fps": results / duration,
+        "server": server,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) * 1000 if latencies else 0.0,
+        },
+        "blink_latency_ms": {
+            "count": len(blinks),
+            "p50": percentile(blinks, 50),
+            "p95": percentile(blinks, 95),
+            "max": max(blinks) * 1000 if blinks else 0.0,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ramp simulated players against a running backend")
+    parser.add_argument("input", help="frame recording (.ebgf) or video file")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="app.py or dlib_app.py address")
+    parser.add_argument("--clients", default="1,2,4,8", help="comma-separated client counts, one step each")
+    parser.add_argument("--fps", type=float, default=15, help="frames per second per client")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per step")
+    parser.add_argument("--transport", choices=("websocket", "polling"),
+                        help="force one Engine.IO transport; default lets the client upgrade")
+    parser.add_argument("--max-p95", type=float, default=0,
+                        help="stop ramping once frame latency p95 exceeds this many ms; 0 = run every step")
+    parser.add_argument("--output", help="write the per-step report as JSON")
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/")
+    frames = [data for _, data in open_frames(args.input)]
+    transports = [args.transport] if args.transport else None
+    print("backend ready:", json.dumps(wait_ready(url).get("startup_s", {}), sort_keys=True))
+
+    steps = []
+    print("clients  sent  results  drop%  fps      p50     p95     p99  blink p50  blink p95")
+    for clients in [int(n) for n in args.clients.split(",")]:
+        step = run_step(url, frames, clients, args.fps, args.duration, transports)
+        steps.append(step)
+        latency = step["latency_ms"]
+        blink = step["blink_latency_ms"]
+        print("%7d %5d %8d %6.1f %5.1f %8.1f %7.1f %7.1f %10.1f %10.1f" %
+              (clients, step["sent"], step["results"], step["server"]["drop_rate"] * 100,
+               step["throughput_fps"], latency["p50"], latency["p95"], latency["p99"],
+               blink["p50"], blink["p95"]))
+        if args.max_p95 and latency["p95"] > args.max_p95:
+            break
+
+    if args.max_p95:
+        within = [s["clients"] for s in steps if s["latency_ms"]["p95"] <= args.max_p95]
+        print("capacity: %s clients within p95 %.0f ms" % (max(within) if within else 0, args.max_p95))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"url": url, "input": args.input, "steps": steps}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
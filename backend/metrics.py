@@ -0,0 +1,158 @@
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+
+import config
+
+# 轻量的 Prometheus 指标：计数器、仪表、直方图，/metrics 路由以文本格式输出
+# METRICS=0 时所有指标都是空操作，开销可以忽略
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, str(v).replace('"', '\\"')) for k, v in items)
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name + _format_labels(key), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(self, name, help, callback=None):
+        super().__init__(name, help)
+        # callback 在输出时才取值（例如当前会话数）
+        self.callback = callback
+
+    def set(self, value, **labels):
+        self.values[_label_key(labels)] = value
+
+    def samples(self):
+        if self.callback is not None:
+            yield self.name, self.callback()
+        else:
+            yield from super().samples()
+
+
+class _Timer:
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            state[0][index] += 1
+        state[1] += value
+        state[2] += 1
+
+    def time(self, **labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                yield self.name + "_bucket" + _format_labels(key, [("le", bound)]), cumulative
+            yield self.name + "_bucket" + _format_labels(key, [("le", "+Inf")]), count
+            yield self.name + "_sum" + _format_labels(key), total
+            yield self.name + "_count" + _format_labels(key), count
+
+
+class _Noop:
+    # 关闭指标时使用：所有方法都什么也不做
+    def inc(self, *args, **kwargs):
+        pass
+
+    set = observe = inc
+
+    def time(self, **labels):
+        return nullcontext()
+
+
+class Registry:
+    def __init__(self, enabled=True, prefix="eyegame_"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.metrics = []
+
+    def _register(self, metric):
+        if not self.enabled:
+            return _Noop()
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help):
+        return self._register(Counter(self.prefix + name, help))
+
+    def gauge(self, name, help, callback=None):
+        return self._register(Gauge(self.prefix + name, help, callback))
+
+    def histogram(self, name, help, buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self.prefix + name, help, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append("# HELP %s %s" % (metric.name, metric.help))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            for name, value in metric.samples():
+                lines.append("%s %s" % (name, value))
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = Registry(enabled=config.METRICS)
+
+# 各进程共用的指标
+STAGE_SECONDS = REGISTRY.histogram("stage_seconds", "Time spent per processing stage")
+FRAMES_RECEIVED = REGISTRY.counter("frames_received_total", "Frames received from clients")
+FRAMES_DROPPED = REGISTRY.counter("frames_dropped_total", "Frames replaced in the mailbox before processing")
+FRAMES_PROCESSED = REGISTRY.counter("frames_processed_total", "Frames taken from the mailbox and processed")
+EMITS = REGISTRY.counter("emits_total", "Socket.IO messages emitted")
+ERRORS = REGISTRY.counter("errors_total", "Frame processing errors")
@@ -0,0 +1,79 @@
+import time
+
+import eventlet
+
+from metrics import REGISTRY
+
+# 模型延迟加载与启动计时：导入模块不再加载模型，模型在第一次使用或预热时才加载；
+# 服务启动后在后台预热（加载模型、推理一张空白帧），完成前 / 返回 503，第一个玩家的第一帧不会碰到冷模型
+# 各阶段耗时（import / 模型加载 / 首次推理 / 预热总耗时）由 / 和 /metrics 报告
+
+# 预热在 tpool 的系统线程里加载模型，第一帧也可能同时在另一个 tpool 线程里加载，需要真正的线程锁
+_threading = eventlet.patcher.original("threading")
+
+STARTUP_SECONDS = REGISTRY.gauge("startup_seconds", "Duration of each startup phase")
+READY = REGISTRY.gauge("ready", "1 once models are loaded and warmed up")
+
+
+class Startup:
+    def __init__(self):
+        self.phases = {}
+        self.started = False
+        self.ready = False
+
+    def record(self, phase, seconds):
+        self.phases[phase] = seconds
+        STARTUP_SECONDS.set(seconds, phase=phase)
+
+    def start(self, spawn, *steps):
+        # 只预热一次：spawn(函数, *参数) 在后台执行 warm_up
+        # 直接运行时由 __main__ 调用；gunicorn 等以导入方式启动时由第一个 HTTP 请求（通常是健康检查）调用
+        if self.started:
+            return
+        self.started = True
+        spawn(self.warm_up, *steps)
+
+    def warm_up(self, *steps):
+        # 依次执行预热函数，返回值为 {阶段: 秒} 时一并记录；失败只记日志，模型仍会在第一帧时延迟加载
+        start = time.perf_counter()
+        for step in steps:
+            try:
+                for phase, seconds in (step() or {}).items():
+                    self.record(phase, seconds)
+            except Exception as e:
+                print("[ERROR] Warm-up failed:", repr(e))
+        self.record("warm_up", time.perf_counter() - start)
+        self.ready = True
+        READY.set(1)
+        print("[INFO] Ready:", ", ".join("%s %.3fs" % item for item in sorted(self.phases.items())))
+
+    def report(self):
+        return {"ready": self.ready, "startup_s": dict(self.phases)}
+
+
+STARTUP = Startup()
+
+
+class LazyModel:
+    # 第一次 get() 时才调用 loader 构造模型，加载耗时记为 <name>_load
+    # 加载可能要几秒，未加载时不要在 eventlet 主循环里调用 get()（会卡住所有连接），放到 tpool 里
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.model = None
+        self.lock = _threading.Lock()
+
+    @property
+    def loaded(self):
+        return self.model is not None
+
+    def get(self):
+        if self.model is None:
+            # 预热和第一帧同时加载时只加载一次，后到的等先到的加载完
+            with self.lock:
+                if self.model is None:
+                    start = time.perf_counter()
+                    model = self.loader()
+                    STARTUP.record(self.name + "_load", time.perf_counter() - start)
+                    self.model = model
+        return self.model
@@ -0,0 +1,45 @@
+import cv2
+import numpy as np
+import mediapipe as mp
+
+import geometry
+
+# /video_feed 上的调试叠加层，只给人看：
+# none：不画；contours：只画眼睛和嘴唇轮廓；full：整张 FaceMesh 网格
+# 所有线段一次 cv2.polylines 画完，不逐条调用 cv2.line
+OVERLAY_LEVELS = ("none", "contours", "full")
+
+_TESSELATION = np.array(sorted(mp.solutions.face_mesh.FACEMESH_TESSELATION), dtype=np.intp)
+_LANDMARK_COLOR = (0, 255, 0)
+_CONNECTION_COLOR = (0, 0, 255)
+
+
+class Overlay:
+    def __init__(self, level="full"):
+        self.set_level(level)
+
+    def set_level(self, level):
+        if level not in OVERLAY_LEVELS:
+            raise ValueError("unknown overlay level: %s" % level)
+        self.level = level
+
+    @property
+    def enabled(self):
+        return self.level != "none"
+
+    def draw(self, frame, face_landmarks, points):
+        # points：geometry.from_proto 得到的眼部 / 嘴部子集，contours 级别直接复用
+        h, w = frame.shape[:2]
+        if self.level == "contours":
+            pixels = (points[:, :2] * (w, h)).astype(np.int32)
+            layout = geometry.MEDIAPIPE
+            contours = [pixels[layout.left_eye], pixels[layout.right_eye],
+                        pixels[layout.mouth_outer], pixels[layout.mouth_inner]]
+            cv2.polylines(frame, contours, True, _LANDMARK_COLOR, 1)
+        elif self.level == "full":
+            pixels = np.array([(p.x * w, p.y * h) for p in face_landmarks.landmark], dtype=np.int32)
+            # 每条边是一条两点折线
+            cv2.polylines(frame, pixels[_TESSELATION], False, _CONNECTION_COLOR, 1)
+            inside = (pixels[:, 0] >= 0) & (pixels[:, 0] < w) & (pixels[:, 1] >= 0) & (pixels[:, 1] < h)
+            visible = pixels[inside]
+            frame[visible[:, 1], visible[:, 0]] = _LANDMARK_COLOR
@@ -0,0 +1,130 @@
+import cv2
+import eventlet
+import eventlet.green.threading as green_threading
+from eventlet import tpool
+
+from metrics import REGISTRY
+
+# 服务端摄像头流水线：采集（原生线程）-> 推理 -> 编码（可选），相邻两级之间只传最新一帧
+# 下游跟不上时上游的旧帧直接被覆盖，每一级按自己的速度运行，延迟不会累积
+
+# 采集线程必须是真正的系统线程：cv2.VideoCapture.read() 阻塞时会释放 GIL，但会卡住 eventlet 主循环
+_threading = eventlet.patcher.original("threading")
+
+PIPELINE_FRAMES = REGISTRY.counter("pipeline_frames_total", "Frames handled by each capture pipeline stage")
+PIPELINE_SKIPPED = REGISTRY.counter("pipeline_frames_skipped_total",
+                                    "Frames overwritten before the next pipeline stage took them")
+PIPELINE_DEPTH = REGISTRY.gauge("pipeline_queue_depth", "Frames waiting in front of each pipeline stage")
+
+
+class FrameGrabber:
+    # 在原生线程里以摄像头的原生帧率循环读取，始终只保留最新的一帧
+    def __init__(self, source=0, stage="inference"):
+        self.source = source
+        # 消费这一帧的下游阶段名，用于指标标签
+        self.stage = stage
+        self.cond = _threading.Condition()
+        self.frame = None
+        self.seq = 0
+        self.taken = 0
+        self.running = False
+        self.thread = None
+        # 每次 start() 一个停止标志：上一个线程迟迟不退出时也不会被新的 start() 重新放行
+        self.stopping = None
+
+    def start(self, timeout=2):
+        # 协程内调用；上一个采集线程（例如卡在 cap.read() 里）在 timeout 秒内还没退出时不启动，返回 False
+        if self.thread is not None:
+            tpool.execute(self.thread.join, timeout)
+            if self.thread.is_alive():
+                return False
+        self.seq = self.taken = 0
+        self.frame = None
+        self.running = True
+        self.stopping = _threading.Event()
+        self.thread = _threading.Thread(target=self._run, args=(self.stopping,), name="frame-grabber", daemon=True)
+        self.thread.start()
+        return True
+
+    def _run(self, stopping):
+        cap = cv2.VideoCapture(self.source)
+        try:
+            while not stopping.is_set():
+                success, frame = cap.read()
+                if not success:
+                    break
+                PIPELINE_FRAMES.inc(stage="capture")
+                with self.cond:
+                    if self.seq > self.taken:
+                        PIPELINE_SKIPPED.inc(stage=self.stage)
+                    self.frame = frame
+                    self.seq += 1
+                    PIPELINE_DEPTH.set(1, stage=self.stage)
+                    self.cond.notify_all()
+        finally:
+            cap.release()
+            with self.cond:
+                self.running = False
+                self.cond.notify_all()
+
+    def _wait(self, seen, timeout):
+        with self.cond:
+            if self.seq == seen and self.running:
+                self.cond.wait(timeout)
+            if self.seq != seen:
+                self.taken = self.seq
+                PIPELINE_DEPTH.set(0, stage=self.stage)
+            return self.seq, self.frame
+
+    def latest(self, seen, timeout=0.5):
+        # 协程内调用：返回 (序号, 帧)，序号等于 seen 表示超时或采集已结束
+        # 等待放在 tpool 的线程里，不阻塞 eventlet 主循环
+        return tpool.execute(self._wait, seen, timeout)
+
+    def stop(self, timeout=2):
+        # 协程内调用：在 tpool 的线程里等采集线程退出，不阻塞 eventlet 主循环；返回线程是否已退出
+        if self.thread is None:
+            return True
+        self.stopping.set()
+        self.running = False
+        tpool.execute(self.thread.join, timeout)
+        if self.thread.is_alive():
+            # 留着 self.thread，下一次 start() 要等它退出
+            return False
+        self.thread = None
+        return True
+
+
+class LatestSlot:
+    # 协程之间传递最新一帧的单槽信箱：put 覆盖尚未取走的旧帧，get 阻塞到有新帧或关闭
+    def __init__(self, stage):
+        self.stage = stage
+        self.cond = green_threading.Condition()
+        self.item = None
+        self.closed = False
+
+    def put(self, item):
+        with self.cond:
+            if self.item is not None:
+                PIPELINE_SKIPPED.inc(stage=self.stage)
+            self.item = item
+            PIPELINE_DEPTH.set(1, stage=self.stage)
+            self.cond.notify()
+
+    def get(self):
+        with self.cond:
+            while self.item is None and not self.closed:
+                self.cond.wait()
+            item, self.item = self.item, None
+            PIPELINE_DEPTH.set(0, stage=self.stage)
+            return item
+
+    def open(self):
+        with self.cond:
+            self.closed = False
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.item = None
+            self.cond.notify_all()
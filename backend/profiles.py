@@ -0,0 +1,90 @@
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+
+import config
+
+# 按用户保存的校准档案：客户端连接时在 auth 里带 profile（前端存在 localStorage 的随机 ID），
+# 回来的玩家直接恢复上次的阈值与比值分布，第一帧就开始检测
+# 磁盘上每个档案一个 JSON 文件 <directory>/<id>.json，内存里用 OrderedDict 做 LRU 缓存最近用过的档案
+# directory 为空时不保存
+
+# 只接受文件名安全的 ID，防止路径穿越
+_PROFILE_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class Profile:
+    # data: {"calibration": {后端: StreamingCalibration.state()}, "settings": {...}, "updated"}
+    # mediapipe 与 dlib 的关键点不同，EAR 的分布也不同，校准按后端分开保存
+    def __init__(self, store, profile_id, data, backend):
+        self.store = store
+        self.id = profile_id
+        self.data = data
+        self.backend = backend
+
+    @property
+    def calibration(self):
+        return (self.data.get("calibration") or {}).get(self.backend)
+
+    @property
+    def settings(self):
+        return self.data.get("settings") or {}
+
+    def save(self, calibration=None, settings=None):
+        if calibration is not None:
+            self.data.setdefault("calibration", {})[self.backend] = calibration
+        if settings is not None:
+            self.data["settings"] = settings
+        self.data["updated"] = time.time()
+        self.store.save(self.id, self.data)
+
+
+class ProfileStore:
+    def __init__(self, directory, capacity=256):
+        self.directory = directory
+        self.capacity = capacity
+        self.cache = OrderedDict()
+
+    def _path(self, profile_id):
+        return os.path.join(self.directory, profile_id + ".json")
+
+    def load(self, profile_id):
+        # 返回档案内容；不存在或损坏时返回空档案
+        data = self.cache.get(profile_id)
+        if data is not None:
+            self.cache.move_to_end(profile_id)
+            return data
+        try:
+            with open(self._path(profile_id)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = {}
+        self._remember(profile_id, data)
+        return data
+
+    def save(self, profile_id, data):
+        # 先写临时文件再替换，进程中途退出也不会留下半个文件
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(profile_id)
+        tmp = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+        self._remember(profile_id, data)
+
+    def _remember(self, profile_id, data):
+        self.cache[profile_id] = data
+        self.cache.move_to_end(profile_id)
+        while len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
+
+    def bind(self, profile_id, backend="mediapipe"):
+        # 客户端传来的 ID -> Profile；未启用或 ID 不合法时返回 None
+        if not self.directory or not isinstance(profile_id, str) or not _PROFILE_ID.match(profile_id):
+            return None
+        return Profile(self, profile_id, self.load(profile_id), backend)
+
+
+STORE = ProfileStore(config.PROFILE_DIR, config.PROFILE_CACHE)
@@ -0,0 +1,142 @@
+import os
+import socket
+import struct
+import threading
+import time
+
+import socketio
+
+# 多进程部署时各服务进程之间转发 Socket.IO 消息：本机 Unix socket 上的一个极简广播代理（broker），
+# 代替 Redis 等外部消息队列。任一进程的 emit 都经代理发给所有进程，由持有该客户端的进程送达
+# 连接建立后先发一帧 "pub:<channel>" 或 "sub:<channel>"；之后每帧为 4 字节长度 + JSON
+# pub 连接只发不收，代理把它发来的每一帧转给同一 channel 的所有 sub 连接（包括发送进程自己的，
+# PubSubManager 按 host_id 忽略自己发出的消息）
+
+_HEADER = struct.Struct("!I")
+
+
+def _send_frame(sock, payload):
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError("connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv_frame(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    return _recv_exact(sock, size)
+
+
+def _connect(path, role, channel):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(path)
+    _send_frame(sock, ("%s:%s" % (role, channel)).encode())
+    return sock
+
+
+class UnixSocketManager(socketio.PubSubManager):
+    # 用法：SocketIO(app, client_manager=UnixSocketManager("unix:///tmp/eyegame.sock"))
+    name = "unix"
+
+    def __init__(self, url, channel="flask-socketio", write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        self.path = url[len("unix://"):] if url.startswith("unix://") else url
+        self.publisher = None
+        # 多个协程可能同时 emit，一帧必须完整写完
+        self.lock = threading.Lock()
+
+    def _publish(self, data):
+        payload = self.json.dumps(data).encode()
+        with self.lock:
+            # 代理重启后重连一次
+            for retries_left in (1, 0):
+                try:
+                    if self.publisher is None:
+                        self.publisher = _connect(self.path, "pub", self.channel)
+                    _send_frame(self.publisher, payload)
+                    return
+                except OSError as e:
+                    if self.publisher is not None:
+                        self.publisher.close()
+                        self.publisher = None
+                    if not retries_left:
+                        self._get_logger().error("Cannot publish to %s: %r", self.path, e)
+
+    def _listen(self):
+        while True:
+            try:
+                sock = _connect(self.path, "sub", self.channel)
+            except OSError as e:
+                self._get_logger().error("Cannot subscribe to %s: %r, retrying", self.path, e)
+                time.sleep(1)
+                continue
+            try:
+                while True:
+                    yield _recv_frame(sock)
+            except (OSError, EOFError) as e:
+                self._get_logger().error("Lost connection to %s: %r, reconnecting", self.path, e)
+            finally:
+                sock.close()
+
+
+def server_options(url):
+    # MESSAGE_QUEUE -> SocketIO 的构造参数：unix:// 用本机代理，其他地址（redis:// 等）交给 Flask-SocketIO，空则单进程
+    if not url:
+        return {}
+    if url.startswith("unix://"):
+        return {"client_manager": UnixSocketManager(url)}
+    return {"message_queue": url}
+
+
+def run_broker(path):
+    # 在当前进程（需已 eventlet.monkey_patch）里运行代理，阻塞直到进程退出
+    import eventlet
+    from eventlet.queue import LightQueue
+
+    subscribers = {}
+
+    def writer(sock, queue):
+        try:
+            while True:
+                sock.sendall(queue.get())
+        except OSError:
+            pass
+
+    def handle(sock):
+        queue = None
+        try:
+            role, _, channel = _recv_frame(sock).decode().partition(":")
+            if role == "sub":
+                queue = LightQueue()
+                subscribers.setdefault(channel, {})[sock] = queue
+                writer(sock, queue)
+                return
+            while True:
+                payload = _recv_frame(sock)
+                frame = _HEADER.pack(len(payload)) + payload
+                # 每个订阅者一个发送队列，慢的进程不拖累其他进程
+                for q in subscribers.get(channel, {}).values():
+                    q.put(frame)
+        except (OSError, EOFError, ValueError):
+            pass
+        finally:
+            if queue is not None:
+                subscribers.get(channel, {}).pop(sock, None)
+            sock.close()
+
+    # 清掉上次异常退出留下的 socket 文件
+    if os.path.exists(path):
+        os.unlink(path)
+    server = eventlet.listen(path, family=socket.AF_UNIX)
+    pool = eventlet.GreenPool()
+    while True:
+        sock, _ = server.accept()
+        pool.spawn_n(handle, sock)
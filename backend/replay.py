@@ -0,0 +1,189 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from framelog import open_frames
+
+# 帧流回放基准：把录制的帧（或视频文件）推给 BlinkDetector，统计吞吐、逐帧延迟和事件序列
+# 不需要摄像头和浏览器，可以在无界面的 CI 上跑
+# 用法：python replay.py session.ebgf [--backend mediapipe|dlib] [--method ear|earm] [--earm-mode center|causal]
+#                        [--fps 30] [--profile ID] [--output report.json] [--expect report.json]
+
+
+def load_backend(name, method="ear", earm_mode=None, profile=None):
+    # 返回 (创建检测器, 处理一帧)，与服务端 consume_frames 走同一条路径
+    # profile：校准档案 ID（PROFILE_DIR 下），回放结束时保存，下一次回放从保存的阈值开始
+    import profiles
+    if name == "dlib":
+        import dlib_app
+
+        def create(emit):
+            return dlib_app.BlinkDetector(emit, "frame_result", profile=profiles.STORE.bind(profile, "dlib"))
+
+        return create, dlib_app.process_image
+
+    import app
+    import config
+    from inference import InferencePool
+    # 回放在当前进程内推理，测到的是单核的真实耗时
+    pool = InferencePool(workers=0, max_num_faces=1, min_detection_confidence=0.5,
+                         min_tracking_confidence=0.5, crop_side=config.CROP_SIDE, crop_pad=config.CROP_PAD)
+
+    def create(emit):
+        return app.BlinkDetector(emit, "replay", "frame_result", pool, method, earm_mode,
+                                 profile=profiles.STORE.bind(profile))
+
+    def process(detector, data):
+        detector.process_frame(detector.decoder.decode(data))
+
+    return create, process
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if len(values) else 0.0
+
+
+def blink_latencies(events, timestamps, ears, window=90):
+    # 帧到事件的延迟：每个 blink_event 所在帧与它之前 window 帧内（不早于上一次眨眼事件）
+    # EAR 最低点所在帧的时间差，近似为眼睛闭得最紧到事件发出之间的时间
+    latencies = []
+    previous = 0
+    for event in events:
+        if event["event"] != "blink_event":
+            continue
+        index = event["index"]
+        start = max(previous, index - window)
+        candidates = [(ears[i], i) for i in range(start, index + 1) if ears[i] is not None]
+        previous = index + 1
+        if candidates:
+            trough = min(candidates)[1]
+            latencies.append((timestamps[index] - timestamps[trough], index - trough))
+    return latencies
+
+
+def replay(frames, backend="mediapipe", fps=0, warmup=5, method="ear", earm_mode=None, profile=None):
+    create, process = load_backend(backend, method, earm_mode, profile)
+    results = []
+    detector = create(lambda event, data: results.append(data) if event == "frame_result" else None)
+
+    events = []
+    latencies = []
+    timestamps = []
+    ears = []
+    start = time.perf_counter()
+    count = 0
+    for index, (timestamp, data) in enumerate(frames):
+        if fps:
+            # 固定帧率推送；处理跟不上时不等待，直接处理下一帧
+            delay = start + index / fps - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        began = time.perf_counter()
+        process(detector, data)
+        if index >= warmup:
+            latencies.append(time.perf_counter() - began)
+        for result in results:
+            for name, payload in result["events"]:
+                events.append({"index": index, "time": timestamp, "event": name, "data": payload})
+        # 没有检测到人脸的帧记为 None
+        ears.append(results[-1]["ratios"]["avg"] if results and results[-1]["ratios"] else None)
+        timestamps.append(timestamp)
+        results.clear()
+        count += 1
+    elapsed = time.perf_counter() - start
+    detector.close()
+
+    blinks = blink_latencies(events, timestamps, ears)
+    blink_ms = [seconds * 1000 for seconds, _ in blinks]
+    blink_frames = [frames for _, frames in blinks]
+    # 连接后第一条眼睛状态 / 眨眼事件的时间（校准完成前检测是否已经可用）
+    first = next((e for e in events if e["event"] != "calibrated"), None)
+    counts = {}
+    for event in events:
+        counts[event["event"]] = counts.get(event["event"], 0) + 1
+    summary = {
+        "backend": backend,
+        "method": method,
+        "frames": count,
+        "elapsed_s": elapsed,
+        "fps": count / elapsed if elapsed else 0.0,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": max(latencies) * 1000 if latencies else 0.0,
+        },
+        "blink_latency": {
+            "count": len(blinks),
+            "p50_ms": float(np.median(blink_ms)) if blinks else 0.0,
+            "max_ms": max(blink_ms) if blinks else 0.0,
+            "p50_frames": float(np.median(blink_frames)) if blinks else 0.0,
+            "max_frames": max(blink_frames) if blinks else 0,
+        },
+        "first_event": {
+            "frame": first["index"] if first else None,
+            "s": first["time"] - timestamps[0] if first else None,
+        },
+        "events": counts,
+    }
+    return summary, events
+
+
+def compare(events, expected):
+    # 只比较 (帧序号, 事件名) 序列，返回第一处不同，完全一致返回 None
+    actual = [(e["index"], e["event"]) for e in events]
+    wanted = [(e["index"], e["event"]) for e in expected]
+    for i, (a, b) in enumerate(zip(actual, wanted)):
+        if a != b:
+            return "event %d: got %s, expected %s" % (i, a, b)
+    if len(actual) != len(wanted):
+        return "got %d events, expected %d" % (len(actual), len(wanted))
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded frames through BlinkDetector")
+    parser.add_argument("input", help="frame recording (.ebgf) or video file")
+    parser.add_argument("--backend", choices=("mediapipe", "dlib"), default="mediapipe")
+    parser.add_argument("--method", choices=("ear", "earm"), default="ear",
+                        help="blink detection method (mediapipe backend only)")
+    parser.add_argument("--earm-mode", choices=("center", "causal"),
+                        help="EARM evaluation point; defaults to EARM_MODE")
+    parser.add_argument("--fps", type=float, default=0, help="push rate; 0 = as fast as possible")
+    parser.add_argument("--profile", help="calibration profile ID to start from and save to")
+    parser.add_argument("--warmup", type=int, default=5, help="frames excluded from latency stats")
+    parser.add_argument("--output", help="write summary and event sequence as JSON")
+    parser.add_argument("--expect", help="compare the event sequence with a previous --output file")
+    args = parser.parse_args()
+
+    summary, events = replay(open_frames(args.input), args.backend, args.fps, args.warmup,
+                             args.method, args.earm_mode, args.profile)
+    latency = summary["latency_ms"]
+    print("%s: %d frames in %.2fs, %.1f fps" % (args.backend, summary["frames"], summary["elapsed_s"], summary["fps"]))
+    print("latency ms  p50 %.2f  p95 %.2f  p99 %.2f  max %.2f" %
+          (latency["p50"], latency["p95"], latency["p99"], latency["max"]))
+    blink = summary["blink_latency"]
+    print("blink latency  p50 %.1f ms (%.1f frames)  max %.1f ms (%d frames)  over %d blinks" %
+          (blink["p50_ms"], blink["p50_frames"], blink["max_ms"], blink["max_frames"], blink["count"]))
+    first = summary["first_event"]
+    if first["frame"] is not None:
+        print("first event  frame %d (%.2f s)" % (first["frame"], first["s"]))
+    print("events", json.dumps(summary["events"], sort_keys=True))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "events": events}, f, indent=2)
+    if args.expect:
+        with open(args.expect) as f:
+            mismatch = compare(events, json.load(f)["events"])
+        if mismatch:
+            print("[ERROR] Event sequence mismatch:", mismatch)
+            sys.exit(1)
+        print("event sequence matches", args.expect)
+
+
+if __name__ == "__main__":
+    main()
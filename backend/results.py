@@ -0,0 +1,116 @@
+import time
+
+# 单帧检测结果：一帧内的关键点、比值和状态事件合并成一个 frame_result 消息，一次 emit 发出
+# 旧的逐事件消息（eye_landmarks / eye_state / blink_event / ear_value ...）作为兼容层保留
+
+EVENT_MODES = ("frame_result", "legacy", "both")
+
+# 关键点格式：json 为嵌套列表；int16 / float32 为二进制（Socket.IO 以附件发送，不做 JSON 序列化）
+LANDMARK_FORMATS = ("json", "int16", "float32")
+LANDMARK_PARTS = ("left_eye", "right_eye", "mouth_outer", "mouth_inner")
+# int16 量化：坐标乘以该值取整，归一化坐标的精度约 6e-5
+INT16_SCALE = 16384
+
+
+class LandmarkEncoder:
+    # 按客户端连接时协商的格式编码关键点，并限制关键点的发送频率（与检测帧率无关）
+    def __init__(self, format="json", z=True, fps=0):
+        self.format = format
+        self.dims = 3 if z else 2
+        self.interval = 1.0 / fps if fps > 0 else 0
+        self.last = None
+
+    def due(self, now=None):
+        # 本帧是否发送关键点（按 fps 限速），每帧调用一次
+        if not self.interval:
+            return True
+        now = time.monotonic() if now is None else now
+        if self.last is not None and now - self.last < self.interval:
+            return False
+        self.last = now
+        return True
+
+    def encode(self, points, layout):
+        # points：子集 (K, 3) 归一化坐标
+        points = points[:layout.size, :self.dims]
+        if self.format == "json":
+            return {part: points[getattr(layout, part)].tolist() for part in LANDMARK_PARTS}
+        if self.format == "int16":
+            data = (points * INT16_SCALE).round().clip(-32768, 32767).astype("<i2")
+            scale = INT16_SCALE
+        else:
+            data = points.astype("<f4")
+            scale = 1
+        slices = [getattr(layout, part) for part in LANDMARK_PARTS]
+        # 各部分在子集里按 LANDMARK_PARTS 顺序连续排列，前端按 counts 切分
+        return {
+            "format": self.format,
+            "scale": scale,
+            "dims": self.dims,
+            "counts": [s.stop - s.start for s in slices],
+            "data": data.tobytes(),
+        }
+
+
+def landmark_encoder(options):
+    # 从连接选项（auth）构造：landmarks 格式、landmark_z 是否带 z、landmark_fps 关键点最高发送频率
+    format = options.get("landmarks")
+    if format not in LANDMARK_FORMATS:
+        format = "json"
+    try:
+        fps = float(options.get("landmark_fps") or 0)
+    except (TypeError, ValueError):
+        fps = 0
+    return LandmarkEncoder(format, bool(options.get("landmark_z", True)), fps)
+
+
+class FrameResult:
+    def __init__(self, frame, seq=None):
+        self.frame = frame
+        # 客户端给这一帧的序号（没有则为 None），原样返回
+        self.seq = seq
+        self.landmarks = None
+        self.ratios = None
+        self.calibrating = False
+        self.events = []
+        # 多人模式下每个玩家的关键点与比值；顶层字段为编号最小的玩家，兼容单人前端
+        self.players = []
+
+    def add(self, name, data, player=None):
+        # data 在调用时就已构造好，不会像延迟执行的 lambda 那样读到之后帧的计数
+        if player is not None:
+            data["player"] = player
+        self.events.append([name, data])
+
+    def add_player(self, player, landmarks, ratios, calibrating):
+        self.players.append({"player": player, "landmarks": landmarks, "ratios": ratios,
+                             "calibrating": calibrating})
+
+    def to_payload(self):
+        return {
+            "frame": self.frame,
+            "seq": self.seq,
+            "landmarks": self.landmarks,
+            "ratios": self.ratios,
+            "calibrating": self.calibrating,
+            "events": self.events,
+            "players": self.players,
+        }
+
+    def legacy_events(self):
+        # 与旧版逐事件发送的顺序一致
+        if self.landmarks is not None:
+            yield "eye_landmarks", self.landmarks
+        for name, data in self.events:
+            yield name, data
+        # 校准期间检测不停顿，比值照常发送
+        if self.ratios is not None:
+            yield "ear_value", {"value": self.ratios["avg"]}
+
+
+def publish(emit, result, mode):
+    if mode in ("legacy", "both"):
+        for name, data in result.legacy_events():
+            emit(name, data)
+    if mode in ("frame_result", "both"):
+        emit("frame_result", result.to_payload())
@@ -0,0 +1,128 @@
+import eventlet
+
+eventlet.monkey_patch()
+
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import zlib
+
+from pubsub import run_broker
+
+# 多进程部署启动器：本进程运行消息代理（pubsub.run_broker）和一个按客户端 IP 哈希的粘性 TCP 代理，
+# 并启动 N 个服务进程（app.py / dlib_app.py，端口依次递增）；服务进程的 emit 经代理转发给持有该客户端的进程
+# 按 IP 粘性：Engine.IO 长轮询的每个请求、同一页面的多条连接（同一 channel）以及 /start_calibration 都落到同一进程
+# 用法：python serve.py [--workers 4] [--port 5000] [--app app] [--socket /tmp/eyegame.sock]
+# 也可以换成 nginx 的 ip_hash 上游 + 同样的 MESSAGE_QUEUE
+
+
+def _pipe(src, dst):
+    try:
+        while True:
+            data = src.recv(65536)
+            if not data:
+                break
+            dst.sendall(data)
+    except OSError:
+        pass
+    finally:
+        try:
+            dst.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+
+def _proxy(client, address, ports):
+    port = ports[zlib.crc32(address[0].encode()) % len(ports)]
+    try:
+        upstream = eventlet.connect(("127.0.0.1", port))
+    except OSError:
+        # 服务进程还没起来或正在重启，客户端会自动重连
+        client.close()
+        return
+    reverse = eventlet.spawn(_pipe, upstream, client)
+    _pipe(client, upstream)
+    reverse.wait()
+    client.close()
+    upstream.close()
+
+
+class Workers:
+    def __init__(self, script, ports, env):
+        self.script = script
+        self.ports = ports
+        self.env = env
+        self.procs = {}
+
+    def spawn(self, port):
+        env = dict(self.env, PORT=str(port))
+        self.procs[port] = subprocess.Popen([sys.executable, self.script], env=env,
+                                            cwd=os.path.dirname(os.path.abspath(__file__)))
+
+    def start(self):
+        for port in self.ports:
+            self.spawn(port)
+
+    def watch(self):
+        # 服务进程异常退出时原端口重启，该进程上的客户端重连后重新分到它
+        while True:
+            eventlet.sleep(1)
+            for port, proc in list(self.procs.items()):
+                if proc.poll() is not None:
+                    print("[ERROR] Worker on port %d exited with %s, restarting" % (port, proc.returncode))
+                    self.spawn(port)
+
+    def stop(self):
+        for proc in self.procs.values():
+            proc.terminate()
+        for proc in self.procs.values():
+            try:
+                proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run several backend processes behind a sticky proxy")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="backend processes (default: half the CPU count)")
+    parser.add_argument("--port", type=int, default=5000, help="public port; workers use the following ports")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--app", choices=("app", "dlib_app"), default="app")
+    parser.add_argument("--socket", default="/tmp/eyegame-%d.sock" % os.getpid(), help="broker Unix socket path")
+    args = parser.parse_args()
+
+    eventlet.spawn(run_broker, args.socket)
+    while not os.path.exists(args.socket):
+        eventlet.sleep(0.01)
+
+    env = dict(os.environ, MESSAGE_QUEUE="unix://" + args.socket)
+    # 每个服务进程各有自己的推理进程，默认把 CPU 平分给它们
+    env.setdefault("INFERENCE_WORKERS", str(max(1, (os.cpu_count() or 2) // args.workers - 1)))
+    ports = [args.port + 1 + i for i in range(args.workers)]
+    workers = Workers(args.app + ".py", ports, env)
+    workers.start()
+    eventlet.spawn(workers.watch)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
+    server = eventlet.listen((args.host, args.port))
+    print("[INFO] Proxying %s:%d to %d workers on ports %d-%d" %
+          (args.host, args.port, args.workers, ports[0], ports[-1]))
+    pool = eventlet.GreenPool()
+    try:
+        while True:
+            client, address = server.accept()
+            pool.spawn_n(_proxy, client, address, ports)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        workers.stop()
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
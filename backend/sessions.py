@@ -0,0 +1,100 @@
+# 会话注册表：每个 Socket.IO 连接（sid）独立持有检测器状态与校准
+# 同一个前端页面可能建立多条连接（游戏组件各自 io()），它们通过 channel 归入同一个房间，
+# 检测结果只发往该房间，而不是广播给所有客户端
+import os
+
+from flow import FlowController
+from framelog import FrameRecorder
+from ingest import FrameMailbox
+
+
+class Session:
+    def __init__(self, sid, channel, factory, mailbox_slots=1, options=None):
+        self.sid = sid
+        self.channel = channel
+        # 客户端连接时通过 auth 传来的选项（事件格式等）
+        self.options = options or {}
+        self._factory = factory
+        self._detector = None
+        # 检测器创建前收到的重新校准请求，创建时再执行
+        self.recalibrate = False
+        # 收到的帧先进信箱，由 consumer 协程按自己的节奏取最新帧处理
+        self.mailbox = FrameMailbox(mailbox_slots)
+        # 根据处理耗时和丢帧率给客户端推荐发送参数
+        self.flow = FlowController(self.mailbox)
+        self.consumer = None
+        self.recorder = None
+        self.closed = False
+
+    @property
+    def detector(self):
+        # 只有真正发送帧的连接才会创建检测器（以及它的人脸跟踪模型）
+        if self._detector is None:
+            self._detector = self._factory(self)
+            if self.recalibrate:
+                self.recalibrate = False
+                self._detector.start_calibration()
+        return self._detector
+
+    @property
+    def has_detector(self):
+        return self._detector is not None
+
+    def start_calibration(self):
+        # 前端连上就请求重新校准，这时通常还没有收到第一帧、没有检测器
+        if self._detector is None:
+            self.recalibrate = True
+        else:
+            self._detector.start_calibration()
+
+    def record(self, data, directory):
+        # 录制收到的原始帧，供 replay.py 离线回放
+        if self.recorder is None:
+            self.recorder = FrameRecorder(os.path.join(directory, "%s.ebgf" % self.sid))
+        self.recorder.write(data)
+
+    def stats(self):
+        return dict(self.mailbox.stats(), sid=self.sid, channel=self.channel)
+
+    def close(self):
+        self.closed = True
+        self.mailbox.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self._detector is not None and hasattr(self._detector, "close"):
+            self._detector.close()
+        self._detector = None
+
+
+class SessionRegistry:
+    def __init__(self, factory, mailbox_slots=1):
+        self.factory = factory
+        self.mailbox_slots = mailbox_slots
+        self.sessions = {}
+
+    def open(self, sid, channel=None, options=None):
+        session = Session(sid, channel or sid, self.factory, self.mailbox_slots, options)
+        self.sessions[sid] = session
+        return session
+
+    def get(self, sid):
+        # 只有 connect 事件会建立会话：断开后仍在排队的 frame 事件不能把会话（以及检测器、消费协程）重新建出来；
+        # 热重载后客户端会重新连接，届时再建立
+        return self.sessions.get(sid)
+
+    def close(self, sid):
+        session = self.sessions.pop(sid, None)
+        if session is not None:
+            session.close()
+        return session
+
+    def start_calibration(self, channel):
+        for session in list(self.sessions.values()):
+            if session.channel == channel:
+                session.start_calibration()
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def __iter__(self):
+        return iter(list(self.sessions.values()))
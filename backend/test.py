@@ -1,12 +1,12 @@
 from flask import Flask, Response, render_template
 import cv2
 import mediapipe as mp
-from math import sqrt
 from flask_cors import CORS
 from flask_socketio import SocketIO
 from threading import Thread, Event, Lock
 import time
 import eventlet
+import geometry
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
 CORS(app)
@@ -17,10 +17,6 @@ mp_drawing = mp.solutions.drawing_utils
 mp_face_mesh = mp.solutions.face_mesh
 face_mesh = mp_face_mesh.FaceMesh(static_image_mode=False, max_num_faces=2, min_detection_confidence=0.5)
 
-# 眼部关键点索引
-LEFT_EYE = [33, 160, 158, 133, 153, 144]
-RIGHT_EYE = [362, 385, 387, 263, 373, 380]
-
 class VideoStreamer:
     def __init__(self):
         self.frame = None
@@ -71,10 +67,8 @@ class VideoStreamer:
                     )
 
                     # 眨眼检测逻辑
-                    landmarks = [(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark]
-                    left_ratio = self._blink_ratio(landmarks, LEFT_EYE)
-                    right_ratio = self._blink_ratio(landmarks, RIGHT_EYE)
-                    avg_ratio = (left_ratio + right_ratio) / 2
+                    points = geometry.from_proto(face_landmarks)
+                    left_ratio, right_ratio, avg_ratio, _ = geometry.face_ratios(points).tolist()
 
                     if avg_ratio < 0.3:
                         self.blink_counter += 1
@@ -92,18 +86,6 @@ class VideoStreamer:
                 self.frame = buffer.tobytes()
         eventlet.sleep(0.033)
 
-    def _blink_ratio(self, landmarks, eye_points):
-        def euclidean_distance(p1, p2):
-            x1, y1, z1 = p1
-            x2, y2, z2 = p2
-            return sqrt((x2 - x1)**2 + (y2 - y1)**2 + (z2 - z1)**2)
-
-        hor_distance = euclidean_distance(landmarks[eye_points[0]], landmarks[eye_points[3]])
-        ver_distance1 = euclidean_distance(landmarks[eye_points[1]], landmarks[eye_points[5]])
-        ver_distance2 = euclidean_distance(landmarks[eye_points[2]], landmarks[eye_points[4]])
-        ver_distance = (ver_distance1 + ver_distance2) / 2.0
-        return ver_distance / hor_distance if hor_distance != 0 else 0
-
     def generate(self):
         while not self.stop_event.is_set():
             with self.lock:
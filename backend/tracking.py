@@ -0,0 +1,52 @@
+import numpy as np
+
+# 本地多人模式：一帧一次推理得到多张人脸，按关键点质心逐帧匹配到稳定的玩家编号
+
+
+class FaceTracks:
+    # 玩家编号为 0 .. max_players-1；人脸暂时丢失的玩家保留编号 max_missed 帧，
+    # 期间优先给新出现的人脸分配空闲编号，没有空闲编号时才接管丢失玩家的编号
+    def __init__(self, max_players=1, max_distance=0.15, max_missed=15):
+        self.max_players = max_players
+        # 归一化坐标下，相邻两帧质心的最大移动距离
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.centroids = {}
+        self.missed = {}
+
+    def assign(self, faces):
+        # faces: (n, K, D) 归一化坐标 -> 每张脸的玩家编号，超出玩家数的脸为 None
+        centroids = np.asarray(faces)[..., :2].mean(axis=-2)
+        assigned = [None] * len(centroids)
+        players = list(self.centroids)
+        if players and len(centroids):
+            previous = np.array([self.centroids[p] for p in players])
+            distance = np.linalg.norm(previous[:, None] - centroids[None], axis=-1)
+            # 贪心匹配：每次取全局最近的一对
+            for _ in range(min(len(players), len(centroids))):
+                t, f = np.unravel_index(np.argmin(distance), distance.shape)
+                if distance[t, f] > self.max_distance:
+                    break
+                assigned[f] = players[t]
+                distance[t, :] = np.inf
+                distance[:, f] = np.inf
+
+        for f in range(len(centroids)):
+            if assigned[f] is None:
+                assigned[f] = next((p for p in range(self.max_players)
+                                    if p not in self.centroids and p not in assigned), None)
+        for f in range(len(centroids)):
+            if assigned[f] is None:
+                assigned[f] = next((p for p in players if p not in assigned), None)
+
+        for p in players:
+            if p not in assigned:
+                self.missed[p] += 1
+                if self.missed[p] > self.max_missed:
+                    del self.centroids[p]
+                    del self.missed[p]
+        for f, p in enumerate(assigned):
+            if p is not None:
+                self.centroids[p] = centroids[f]
+                self.missed[p] = 0
+        return assigned
@@ -1,7 +1,7 @@
 /* eslint-disable no-unused-vars */
 /* eslint-disable react/prop-types */
 import { useEffect, useRef, useState } from "react";
-import io from "socket.io-client";
+import { connectSocket, decodeLandmarks, getChannel } from "../socket";
 import ClassicMode from "./ClassicMode";
 import MusicMode from "./MusicMode";
 import styles from "./BlinkGame.module.css";
@@ -19,6 +19,8 @@ const BlinkGame = () => {
     const streamRef = useRef(null);
     const capRef = useRef(0);
     const sendFrameIntervalRef = useRef(null);
+    // 后端 flow_control 推荐的发送参数，fps 为 0 时按摄像头最大帧率发送
+    const flowRef = useRef({ fps: 0, maxDimension: 0, quality: 0.6 });
     const [mode, setMode] = useState("classic");
     // const [threshold, setThreshold] = useState(null);
     const [calibrated, setCalibrated] = useState(false);
@@ -128,8 +130,10 @@ const BlinkGame = () => {
                 console.error("获取摄像头失败:", err);
             }
 
-            socket.current = io(import.meta.env.VITE_SOCKET_URL, {
+            socket.current = connectSocket({
                 transports: ["websocket"],
+                // 关键点只用来画点：int16 二进制、不要 z、最多 30 次/秒
+                auth: { landmarks: "int16", landmark_z: false, landmark_fps: 30 },
             });
 
             // 已校准 => 读取本地存储的阈值，否则触发校准
@@ -140,9 +144,10 @@ const BlinkGame = () => {
                 console.log("已加载本地阈值:", localThreshold);
             } else {
                 // ⬅️ 第一次使用，发起校准
-                fetch(`${import.meta.env.VITE_SOCKET_URL}/start_calibration`, {
-                    method: "POST",
-                });
+                fetch(
+                    `${import.meta.env.VITE_SOCKET_URL}/start_calibration?channel=${getChannel()}`,
+                    { method: "POST" }
+                );
             }
 
             // 监听校准完成
@@ -156,35 +161,49 @@ const BlinkGame = () => {
             // 发送帧
             const canvas = document.createElement("canvas");
             const ctx = canvas.getContext("2d");
-            sendFrameIntervalRef.current = setInterval(() => {
-                const video = videoRef.current;
-                if (!video) return;
-
-                canvas.width = video.videoWidth || 640;
-                canvas.height = video.videoHeight || 480;
-                ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
-
-                canvas.toBlob(
-                    (blob) => {
-                        if (blob && socket.current?.connected) {
-                            socket.current.emit("frame", blob);
-                        }
-                    },
-                    "image/jpeg",
-                    0.6
-                );
-            }, 1000 / capRef.current);
+            const startSending = () => {
+                clearInterval(sendFrameIntervalRef.current);
+                const { fps, maxDimension, quality } = flowRef.current;
+                const rate = fps ? Math.min(fps, capRef.current) : capRef.current;
+                sendFrameIntervalRef.current = setInterval(() => {
+                    const video = videoRef.current;
+                    if (!video) return;
+
+                    const width = video.videoWidth || 640;
+                    const height = video.videoHeight || 480;
+                    const scale = maxDimension
+                        ? Math.min(1, maxDimension / Math.max(width, height))
+                        : 1;
+                    canvas.width = Math.round(width * scale);
+                    canvas.height = Math.round(height * scale);
+                    ctx.drawImage(video, 0, 0, canvas.width, canvas.height);
+
+                    canvas.toBlob(
+                        (blob) => {
+                            if (blob && socket.current?.connected) {
+                                socket.current.emit("frame", blob);
+                            }
+                        },
+                        "image/jpeg",
+                        quality
+                    );
+                }, 1000 / rate);
+            };
+            startSending();
+
+            // 后端根据处理延迟和丢帧情况调整帧率 / 分辨率 / 质量
+            socket.current.on("flow_control", ({ fps, max_dimension, quality }) => {
+                flowRef.current = { fps, maxDimension: max_dimension, quality };
+                startSending();
+            });
 
             // 画眼睛点
             socket.current.on("eye_landmarks", drawEyePoints);
         };
 
-        const drawEyePoints = ({
-            left_eye,
-            right_eye,
-            mouth_outer,
-            mouth_inner,
-        }) => {
+        const drawEyePoints = (landmarks) => {
+            const { left_eye, right_eye, mouth_outer, mouth_inner } =
+                decodeLandmarks(landmarks);
             const canvas = canvasRef.current;
             const ctx = canvas.getContext("2d");
 
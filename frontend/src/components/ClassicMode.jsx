@@ -1,6 +1,6 @@
 /* eslint-disable react/prop-types */
 import { useEffect, useRef, useState } from "react";
-import { io } from "socket.io-client";
+import { connectSocket } from "../socket";
 import blinkSound from "/sounds/blink.wav";
 import startSound from "/sounds/start.wav";
 import missSound from "/sounds/miss.wav";
@@ -30,7 +30,7 @@ const ClassicMode = ({ onGameEnd }) => {
 
     // 🔄 建立 socket 监听眨眼事件
     useEffect(() => {
-        const socket = io(import.meta.env.VITE_SOCKET_URL, {
+        const socket = connectSocket({
             transports: ["websocket"],
             reconnectionAttempts: 3,
             autoConnect: true,
@@ -1,7 +1,7 @@
 /* eslint-disable react-hooks/exhaustive-deps */
 /* eslint-disable react/prop-types */
 import { useEffect, useRef, useState } from "react";
-import { io } from "socket.io-client";
+import { connectSocket } from "../socket";
 import blinkSound from "/sounds/blink.wav";
 import missSound from "/sounds/miss.wav";
 import blink1Sound from "/sounds/cmd_blink1.mp3";
@@ -88,7 +88,7 @@ const CommandMode = ({ onGameEnd, totalTasks = 15 }) => {
 
     // 👁️ 监听眼睛事件
     useEffect(() => {
-        const socket = io(import.meta.env.VITE_SOCKET_URL);
+        const socket = connectSocket();
 
         socket.on("blink_event", () => {
             const now = Date.now();
@@ -1,5 +1,5 @@
 import { useEffect, useRef, useState } from "react";
-import { io } from "socket.io-client";
+import { connectSocket } from "../socket";
 import musicSound from "/sounds/陶喆-天天.mp3";
 
 const ControlMode = () => {
@@ -10,7 +10,7 @@ const ControlMode = () => {
     const [messageColor, setMessageColor] = useState("white"); // 提示文字颜色
 
     useEffect(() => {
-        const socket = io(import.meta.env.VITE_SOCKET_URL);
+        const socket = connectSocket();
 
         socket.on("eye_state", ({ status }) => {
             setEyeState(status);
@@ -2,7 +2,7 @@
 import { useState, useEffect, useRef } from "react";
 import { ResponsiveLine } from "@nivo/line";
 import { FaFileExport, FaTimes, FaTrash } from "react-icons/fa";
-import { io } from "socket.io-client";
+import { connectSocket } from "../socket";
 import EarmWaveform from "./EarWaveform";
 import "./DataPanel.css";
 
@@ -13,7 +13,7 @@ const DataPanel = ({ onClose, experimentData, setExperimentData }) => {
     // 初始化Socket连接
     useEffect(() => {
         if (!socketRef.current) {
-            socketRef.current = io(import.meta.env.VITE_SOCKET_URL);
+            socketRef.current = connectSocket();
 
             // 监听眼睛特征点事件
             socketRef.current.on("eye_landmarks", (data) => {
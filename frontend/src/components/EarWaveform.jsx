@@ -1,6 +1,6 @@
 import { useState, useEffect, useRef } from "react";
 import { ResponsiveLine } from "@nivo/line";
-import { io } from "socket.io-client";
+import { connectSocket } from "../socket";
 
 const EarWaveform = () => {
     const [data, setData] = useState([
@@ -11,7 +11,7 @@ const EarWaveform = () => {
     const earRef = useRef([]);
 
     useEffect(() => {
-        const socket = io(import.meta.env.VITE_SOCKET_URL);
+        const socket = connectSocket();
 
         setThreshold(localStorage.getItem("threshold") || 0);
 
@@ -1,6 +1,6 @@
 /* eslint-disable no-unused-vars */
 import { useEffect, useRef, useState } from "react";
-import { io } from "socket.io-client";
+import { connectSocket } from "../socket";
 import musicSound from "/sounds/陶喆-天天.mp3";
 
 const MusicMode = () => {
@@ -16,7 +16,7 @@ const MusicMode = () => {
     const lastToggleTime = useRef(0);
 
     useEffect(() => {
-        const socket = io(import.meta.env.VITE_SOCKET_URL);
+        const socket = connectSocket();
 
         socket.on("eye_state", ({ status }) => {
             const now = Date.now();
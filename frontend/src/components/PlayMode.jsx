@@ -1,6 +1,6 @@
 /* eslint-disable react/prop-types */
 import { useEffect, useRef, useState } from "react";
-import { io } from "socket.io-client";
+import { connectSocket } from "../socket";
 import doubleBlink from "/sounds/blink.wav";
 import doubleClosed from "/sounds/blink.wav";
 import leftBlink from "/sounds/start.wav";
@@ -61,7 +61,7 @@ const PlayMode = () => {
 
     // 处理眼睛状态变化
     useEffect(() => {
-        const socket = io(import.meta.env.VITE_SOCKET_URL, {
+        const socket = connectSocket({
             transports: ["websocket"],
             reconnectionAttempts: 3,
             autoConnect: true,
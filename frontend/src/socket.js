@@ -0,0 +1,76 @@
+import { io } from "socket.io-client";
+
+// 同一标签页内的所有连接共用一个 channel，后端只把该页面的检测结果推送到这个房间
+export const getChannel = () => {
+    let channel = sessionStorage.getItem("blinkChannel");
+    if (!channel) {
+        channel =
+            Date.now().toString(36) + Math.random().toString(36).substr(2);
+        sessionStorage.setItem("blinkChannel", channel);
+    }
+    return channel;
+};
+
+// 每个浏览器一个固定的校准档案 ID，后端据此保存阈值，下次连接不必重新校准
+export const getProfile = () => {
+    let profile = localStorage.getItem("blinkProfile");
+    if (!profile) {
+        profile =
+            Date.now().toString(36) + Math.random().toString(36).substr(2);
+        localStorage.setItem("blinkProfile", profile);
+    }
+    return profile;
+};
+
+// 关键点可以是 JSON 列表，也可以是二进制（int16 量化或 float32，见 backend/results.py）
+// 二进制按 left_eye / right_eye / mouth_outer / mouth_inner 顺序连续排列，counts 为各部分点数
+const LANDMARK_PARTS = ["left_eye", "right_eye", "mouth_outer", "mouth_inner"];
+
+export const decodeLandmarks = (landmarks) => {
+    if (!landmarks?.data) return landmarks;
+    const { format, scale, dims, counts, data } = landmarks;
+    const buffer =
+        data instanceof ArrayBuffer
+            ? data
+            : data.buffer.slice(data.byteOffset, data.byteOffset + data.byteLength);
+    const values =
+        format === "int16" ? new Int16Array(buffer) : new Float32Array(buffer);
+    const decoded = {};
+    let offset = 0;
+    LANDMARK_PARTS.forEach((part, i) => {
+        const points = [];
+        for (let p = 0; p < counts[i]; p++) {
+            const point = [];
+            for (let d = 0; d < dims; d++) point.push(values[offset++] / scale);
+            points.push(point);
+        }
+        decoded[part] = points;
+    });
+    return decoded;
+};
+
+// 后端每帧只发一条 frame_result，这里按旧的事件名在本地分发，组件仍然监听 eye_state / blink_event 等
+const dispatchFrameResult = (socket, result) => {
+    const fire = (name, data) =>
+        socket.listeners(name).forEach((listener) => listener(data));
+
+    if (result.landmarks) fire("eye_landmarks", result.landmarks);
+    result.events.forEach(([name, data]) => fire(name, data));
+    if (result.ratios) {
+        fire("ear_value", { value: result.ratios.avg });
+    }
+};
+
+export const connectSocket = (options = {}) => {
+    const socket = io(import.meta.env.VITE_SOCKET_URL, {
+        ...options,
+        auth: {
+            channel: getChannel(),
+            profile: getProfile(),
+            events: "frame_result",
+            ...options.auth,
+        },
+    });
+    socket.on("frame_result", (result) => dispatchFrameResult(socket, result));
+    return socket;
+};